@@ -4,7 +4,6 @@ from __future__ import division
 
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
-import pygame
 import OpenGL.GL as gl
 
 import VisionEgg as ve
@@ -25,6 +24,7 @@ from Experiment import Experiment, info, printf2log
 
 class BlankScreen(Experiment):
     """BlankScreen experiment"""
+    longsession = True # runs until ESC is hit, possibly for hours
     def check(self):
         """Check BlankScreen-specific parameters"""
         super(BlankScreen, self).check()
@@ -33,12 +33,20 @@ class BlankScreen(Experiment):
         """Builds the SweepTable and the Header for this Experiment"""
         self.static.preexpSec = 0
         self.static.postexpSec = 0
+        self.setdinbits()
+        self.initrng()
         self.postval = 0
         self.sweeptable = Core.SweepTable(experiment=self)
         self.sec = 0 # experiment duration
+        if not self.deferheader:
+            self.buildheader()
 
-        # Build the text header
+    def buildheader(self):
+        """Builds the text header and prints it to log. Unlike other Experiments, BlankScreen
+        doesn't save it to a separate file"""
         self.header = Core.Header(experiment=self)
+        if self.dryrun:
+            return # don't log the text header, we're only validating
         info('TextHeader.data:', toscreen=False)
         printf2log(str(self.header.text)) # print text header data to log
 
@@ -65,23 +73,25 @@ class BlankScreen(Experiment):
         grab the frame buffer data at any timepoint (and use for, say, revcorr)
 
         """
+        vsynci = 0
         while True: # sweep loop
 
             # Set sweep bit high, do the sweep
             while True: # vsync loop
-                for event in pygame.event.get(): # for all events in the event queue
-                    if event.type == pygame.locals.KEYDOWN:
-                        if event.key == pygame.locals.K_ESCAPE:
-                            self.quit = True
+                if self.input.poll(): # ESC has been hit
+                    self.quit = True
                 if self.quit:
                     break # out of vsync loop
-                if I.DTBOARDINSTALLED: DT.postInt16(self.postval) # post value to port
-                self.screen.clear()
-                self.viewport.draw()
+                if I.DTBOARDINSTALLED: self.postInt(self.postval) # post value to port
+                # the screen never changes, so only draw it into each buffer once, then just swap them:
+                if vsynci < 2 or I.REDRAWSTATIC:
+                    self.screen.clear()
+                    self.viewport.draw()
                 ve.Core.swap_buffers() # returns immediately
                 gl.glFlush() # waits for next vsync pulse from video card
                 self.vsynctimer.tick()
                 self.nvsyncsdisplayed += 1 # increment
+                vsynci += 1
 
             if self.quit:
                 break # out of sweep loop
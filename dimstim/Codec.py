@@ -0,0 +1,137 @@
+"""Compact encoding of long integer sequences, like movie frame indices, as short Python
+expressions for the TextHeader. Each encoding evals back to a list equal to the original
+sequence, given the decoders rldecode and dvdecode in the namespace. Candidate encodings are:
+
+    - arithmetic progressions, as range(start, stop, step)
+    - sequences made up of a repeated subsequence, as subsequence*n
+    - run-length encoding, as rldecode(values, counts)
+    - delta + zigzag + varint encoding, zlib compressed and base64 encoded, as dvdecode(string)
+
+and the shortest one (plain repr included) is used"""
+
+from __future__ import division
+
+import zlib
+import base64
+
+import numpy as np
+
+MINLEN = 16 # sequences shorter than this are left as is, for readability
+
+
+def isintseq(seq):
+    """Return whether seq is a sequence of integers (bools don't count)"""
+    for val in seq:
+        if not isinstance(val, (int, long, np.integer)) or isinstance(val, (bool, np.bool_)):
+            return False
+    return True
+
+def encode(val):
+    """Return a compact expression for val that evals to an equal value, if val is a long
+    list, tuple or 1D array of integers, otherwise return repr(val). Arrays are encoded as lists"""
+    if isinstance(val, np.ndarray):
+        if val.ndim != 1 or val.dtype.kind not in 'iu':
+            return repr(val)
+        seq = val.tolist()
+    elif isinstance(val, (list, tuple)) and isintseq(val):
+        seq = [ int(x) for x in val ] # get rid of any numpy ints
+    else:
+        return repr(val)
+    if len(seq) < MINLEN:
+        expr = repr(seq)
+    else:
+        expr = shortest(seq)
+    if isinstance(val, tuple):
+        return 'tuple(%s)' % expr
+    return expr
+
+def shortest(seq):
+    """Return the shortest expression that evals to list of ints seq"""
+    exprs = [repr(seq)]
+    for encoder in (apencode, repencode, rlencode, dvencode):
+        expr = encoder(seq)
+        if expr != None:
+            exprs.append(expr)
+    return min(exprs, key=len)
+
+def apencode(seq):
+    """Return seq as a range() expression if it's an arithmetic progression, otherwise None"""
+    if len(seq) < 2:
+        return None
+    step = seq[1] - seq[0]
+    if step == 0: # constant sequences are handled by repencode
+        return None
+    for i in xrange(2, len(seq)):
+        if seq[i] - seq[i-1] != step:
+            return None
+    start, stop = seq[0], seq[-1] + cmp(step, 0)
+    if step == 1:
+        if start == 0:
+            return 'range(%d)' % stop
+        return 'range(%d, %d)' % (start, stop)
+    return 'range(%d, %d, %d)' % (start, stop, step)
+
+def repencode(seq):
+    """Return seq as subsequence*n if it's made up of n > 1 repeats of the shortest possible
+    subsequence, otherwise None. The subsequence is itself encoded as compactly as possible"""
+    n = len(seq)
+    for period in xrange(1, n//2+1):
+        if n % period == 0 and seq[:period] * (n // period) == seq:
+            return '%s*%d' % (shortest(seq[:period]), n // period)
+    return None
+
+def rlencode(seq):
+    """Return seq as a rldecode() expression of the values and counts of its runs"""
+    if not seq:
+        return None
+    values, counts = [seq[0]], [1]
+    for val in seq[1:]:
+        if val == values[-1]:
+            counts[-1] += 1
+        else:
+            values.append(val)
+            counts.append(1)
+    if len(values) == len(seq): # no runs
+        return None
+    return 'rldecode(%s, %s)' % (shortest(values), shortest(counts))
+
+def rldecode(values, counts):
+    """Decode the runs of values and counts generated by rlencode into a list"""
+    seq = []
+    for val, count in zip(values, counts):
+        seq.extend([val]*count)
+    return seq
+
+def dvencode(seq):
+    """Return seq as a dvdecode() expression of the zigzag encoded differences between
+    consecutive values, stored as varints, zlib compressed and base64 encoded"""
+    chars = []
+    prev = 0
+    for val in seq:
+        d = val - prev
+        prev = val
+        z = d << 1 if d >= 0 else ((-d) << 1) - 1 # zigzag: 0, -1, 1, -2, 2... -> 0, 1, 2, 3, 4...
+        while z >= 0x80: # 7 bits per byte, high bit set on all but the last byte of each value
+            chars.append(chr(z & 0x7f | 0x80))
+            z >>= 7
+        chars.append(chr(z))
+    s = base64.b64encode(zlib.compress(''.join(chars), 9))
+    return 'dvdecode(%r)' % s
+
+def dvdecode(s):
+    """Decode the string generated by dvencode into a list"""
+    seq = []
+    val = 0
+    z = 0
+    shift = 0
+    for c in zlib.decompress(base64.b64decode(s)):
+        b = ord(c)
+        z |= (b & 0x7f) << shift
+        if b & 0x80: # more bytes to come for this value
+            shift += 7
+        else:
+            val += (z >> 1) ^ -(z & 1) # undo the zigzag, accumulate the difference
+            seq.append(val)
+            z = 0
+            shift = 0
+    return seq
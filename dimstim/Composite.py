@@ -0,0 +1,355 @@
+"""Defines the Composite Experiment, for displaying several stimuli at once, like extra-classical
+bars around a grating centered on the RF, or a pair of flashed bars. Each stimulus is a
+Component, with a name that prefixes all of its params, like s.center_orioff or d.flank_ori.
+Any of them can be made a Variable, so all Components share one SweepTable, and each sweep
+table index sets every Component's params at once. Params shared by all Components, like
+sweepSec, postsweepSec and bgbrightness, go unprefixed. Every Component also has an optional
+dynamic on param, like d.flank_on, that defaults to True, for turning it off in some sweeps.
+Components are drawn in order, the first one at the bottom"""
+
+from __future__ import division
+
+import math
+import re
+import numpy as np
+np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
+import OpenGL.GL as gl
+
+import VisionEgg as ve
+import VisionEgg.Core
+from VisionEgg.MoreStimuli import Target2D
+from VisionEgg.Gratings import SinGrating2D
+from VisionEgg.Textures import Mask2D, TextureStimulus, Texture
+
+import Constants as C
+from Constants import I
+import Core
+from Core import sec2intvsync, degSec2pixVsync, cycDeg2cycPix, cycSec2cycVsync, deg2pix, toiter
+try:
+    from Core import DT # only importable if DT board is installed
+except ImportError:
+    pass
+from Experiment import Experiment
+from Movie import readheader, frameshape, checksize, GLFORMATS
+
+NAMERE = re.compile(r'^[A-Za-z][A-Za-z0-9]*$') # Component names can't have underscores
+
+
+class Component(object):
+    """Base class for stimuli displayed by a Composite. Subclasses list the names of the
+    static and dynamic params they need, without the prefix, and give defaults for any
+    dynamic params that are optional"""
+    staticparams = []
+    dynamicparams = []
+    defaults = {'on': True}
+
+    def __init__(self, name):
+        assert NAMERE.match(name), 'Component name %r must be alphanumeric, and start with a letter' % name
+        self.name = name
+        self.prefix = name + '_' # of all of this Component's params
+
+    def check(self, e):
+        """Check that Composite e has all of this Component's params, set defaults for
+        the optional ones it doesn't have"""
+        self.e = e
+        for paramname in self.staticparams:
+            assert self.prefix+paramname in e.static, 'static.%s%s is missing' % (self.prefix, paramname)
+        defaults = {}
+        for cls in reversed(type(self).__mro__): # subclass defaults override base class ones
+            defaults.update(cls.__dict__.get('defaults', {}))
+        for paramname, default in defaults.items():
+            if self.prefix+paramname not in e.dynamic:
+                e.dynamic[self.prefix+paramname] = default
+        for paramname in self.dynamicparams:
+            assert self.prefix+paramname in e.dynamic, 'dynamic.%s%s is missing' % (self.prefix, paramname)
+
+    def build(self):
+        """Do any time consuming preparation that doesn't need the screen"""
+        pass
+
+    def s(self, paramname):
+        """Return the value of this Component's static param paramname"""
+        return self.e.static[self.prefix+paramname]
+
+    def d(self, paramname, i):
+        """Return the value of this Component's dynamic param paramname for sweep table index i"""
+        return self.e.st[self.prefix+paramname][i]
+
+    def createstimuli(self):
+        """Create this Component's VisionEgg stimuli, return them in drawing order"""
+        raise NotImplementedError
+
+    def updateparams(self, i, nvsyncs):
+        """Update stimulus params for sweep table index i, lasting nvsyncs. Return a list of
+        the params that change on every vsync of the sweep, as (params, name, vals) tuples,
+        where vals holds the value for each vsync. Leave out params that don't change"""
+        raise NotImplementedError
+
+    def off(self):
+        """Turn off this Component's stimuli"""
+        for stimulus in self.stimuli:
+            stimulus.parameters.on = False
+
+
+class BarComponent(Component):
+    """Drifting/stationary bar, same params as the Bar Experiment"""
+    staticparams = ['orioff']
+    dynamicparams = ['ori', 'widthDeg', 'heightDeg', 'brightness', 'xposDeg', 'yposDeg']
+    defaults = {'speedDegSec': 0, 'antialiase': True}
+
+    def createstimuli(self):
+        self.target = Target2D(anchor='center', on=False) # keep it off until first sweep starts
+        self.tp = self.target.parameters # synonym
+        self.stimuli = (self.target,)
+        return self.stimuli
+
+    def updateparams(self, i, nvsyncs):
+        e = self.e # synonym
+        self.tp.on = bool(self.d('on', i))
+        ori = self.s('orioff') + self.d('ori', i)
+        self.tp.orientation = ori
+        self.tp.size = deg2pix(self.d('widthDeg', i)), deg2pix(self.d('heightDeg', i))
+        brightness = self.d('brightness', i)
+        self.tp.color = brightness, brightness, brightness, 1.0
+        self.tp.anti_aliasing = self.d('antialiase', i)
+        x0 = e.xorig + deg2pix(self.d('xposDeg', i))
+        y0 = e.yorig + deg2pix(self.d('yposDeg', i))
+        speed = degSec2pixVsync(self.d('speedDegSec', i))
+        if not speed: # stationary, nothing to push on every vsync
+            self.tp.position = x0, y0
+            return []
+        # generate position as a f'n of vsynci for this sweep, centered on (x0, y0)
+        distance = speed * nvsyncs # total distance to travel on this sweep
+        direction = (ori + 90) / 180 * math.pi # always |_ to current ori
+        x = x0 + math.cos(direction) * (speed * np.arange(nvsyncs) - distance / 2)
+        y = y0 + math.sin(direction) * (speed * np.arange(nvsyncs) - distance / 2)
+        return [(self.tp, 'position', zip(x, y))]
+
+
+class GratingComponent(Component):
+    """Drifting/flashed sine grating, same params as the Grating Experiment"""
+    staticparams = ['orioff', 'widthDeg', 'heightDeg', 'mask']
+    dynamicparams = ['ori', 'xposDeg', 'yposDeg', 'sfreqCycDeg', 'tfreqCycSec', 'phase0',
+                     'contrast', 'ml', 'diameterDeg']
+
+    def createstimuli(self):
+        # Create instances of the Mask2D class, one for each diameter
+        self.masks = {}
+        if self.s('mask'):
+            self.nmasksamples = 512 # number of samples in mask, must be power of 2, quality/performance tradeoff
+            samplesperpix = self.nmasksamples / deg2pix(min(self.s('widthDeg'), self.s('heightDeg')))
+            for diameterDeg in toiter(self.e.dynamic[self.prefix+'diameterDeg']):
+                radiusSamples = samplesperpix * deg2pix(diameterDeg / 2) # in mask samples
+                self.masks[diameterDeg] = Mask2D(function=self.s('mask'),
+                                                 radius_parameter=radiusSamples, # sigma for gaussian, radius for circle, in units of mask samples
+                                                 num_samples=(self.nmasksamples, self.nmasksamples)) # size of mask texture data (# of texels)
+        self.height = deg2pix(self.s('heightDeg'))
+        self.grating = SinGrating2D(anchor='center',
+                                    size=(self.height, deg2pix(self.s('widthDeg'))), # swapped, see Grating.py
+                                    ignore_time=True, # don't use this class' own time f'n
+                                    num_samples=2048, # number of samples of sine f'n, must be power of 2
+                                    max_alpha=1.0, # opaque
+                                    on=False) # keep it off until first sweep starts
+        self.gp = self.grating.parameters # synonym
+        self.stimuli = (self.grating,)
+        return self.stimuli
+
+    def updateparams(self, i, nvsyncs):
+        e = self.e # synonym
+        self.gp.on = bool(self.d('on', i))
+        sfreq = cycDeg2cycPix(self.d('sfreqCycDeg', i))
+        phaseoffset = self.height / 2 * sfreq * 360 + 180 # makes phase0 the phase at the centre, see Grating.py
+        phasestep = cycSec2cycVsync(self.d('tfreqCycSec', i)) * 360 # delta cycles per vsync, in degrees of sinusoid
+        phase0 = -self.d('phase0', i) - phaseoffset
+        self.gp.position = e.xorig+deg2pix(self.d('xposDeg', i)), e.yorig+deg2pix(self.d('yposDeg', i))
+        self.gp.orientation = self.s('orioff') + self.d('ori', i) + 90 # VE's ori is the direction of motion, see Grating.py
+        if self.masks:
+            self.gp.mask = self.masks[self.d('diameterDeg', i)]
+        self.gp.spatial_freq = sfreq
+        self.gp.pedestal = self.d('ml', i)
+        self.gp.contrast = self.d('contrast', i)
+        self.gp.phase_at_t0 = phase0
+        if not phasestep: # stationary, nothing to push on every vsync
+            return []
+        return [(self.gp, 'phase_at_t0', phase0 - phasestep * np.arange(nvsyncs))]
+
+
+class CellComponent(Component):
+    """Single sparse noise cell on a grid, same params as the SparseNoise Experiment"""
+    staticparams = ['orioff', 'ncellswide', 'ncellshigh', 'widthDeg', 'heightDeg']
+    dynamicparams = ['xi', 'yi', 'ori', 'xposDeg', 'yposDeg', 'brightness']
+    defaults = {'antialiase': True}
+
+    def createstimuli(self):
+        self.cellwidth = deg2pix(self.s('widthDeg') / self.s('ncellswide')) # in pix
+        self.cellheight = deg2pix(self.s('heightDeg') / self.s('ncellshigh')) # in pix
+        # center of grid, in units of 0-based cell index:
+        self.xi0 = (self.s('ncellswide') - 1) / 2
+        self.yi0 = (self.s('ncellshigh') - 1) / 2
+        self.target = Target2D(anchor='center', on=False) # keep it off until first sweep starts
+        self.tp = self.target.parameters # synonym
+        self.tp.size = self.cellwidth, self.cellheight # static, only needs to be done once
+        self.stimuli = (self.target,)
+        return self.stimuli
+
+    def updateparams(self, i, nvsyncs):
+        e = self.e # synonym
+        self.tp.on = bool(self.d('on', i))
+        ori = self.s('orioff') + self.d('ori', i)
+        theta = ori / 180 * math.pi
+        dxi = self.d('xi', i) - self.xi0 # destination index - origin index
+        dyi = self.d('yi', i) - self.yi0
+        dx = dxi*self.cellwidth*math.cos(theta) - dyi*self.cellheight*math.sin(theta) # see SparseNoise.png for the trigonometry
+        dy = dxi*self.cellwidth*math.sin(theta) + dyi*self.cellheight*math.cos(theta)
+        self.tp.position = (e.xorig + deg2pix(self.d('xposDeg', i)) + dx,
+                            e.yorig + deg2pix(self.d('yposDeg', i)) + dy)
+        self.tp.orientation = ori
+        brightness = self.d('brightness', i)
+        self.tp.color = brightness, brightness, brightness, 1.0
+        self.tp.anti_aliasing = self.d('antialiase', i)
+        return []
+
+
+class MovieComponent(Component):
+    """Movie, greyscale or colour, memory-mapped from its movie file. Same params as the Movie
+    Experiment, except there's no mask"""
+    staticparams = ['fname', 'orioff', 'widthDeg', 'heightDeg']
+    dynamicparams = ['framei', 'ori', 'xposDeg', 'yposDeg']
+    defaults = {'invert': False}
+
+    def build(self):
+        """Memory-map the movie file"""
+        fname = self.s('fname')
+        f = file(fname, 'rb')
+        ncellswide, ncellshigh, nframes, self.nchannels, offset = readheader(f)
+        f.close()
+        checksize(fname, offset, nframes, ncellshigh*ncellswide*self.nchannels)
+        assert max(toiter(self.e.dynamic[self.prefix+'framei'])) <= nframes-1, 'Frame indices exceed size of movie %r of %d frames' % (fname, nframes)
+        self.shape = frameshape(ncellswide, ncellshigh, self.nchannels)
+        self.frames = np.memmap(fname, dtype=np.uint8, mode='r', offset=offset, shape=(nframes,)+self.shape)
+        self.frames = self.frames[::, ::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
+
+    def createstimuli(self):
+        self.texturestimulus = TextureStimulus(texture=Texture(np.zeros(self.shape, dtype=np.uint8)), # frames get uploaded as needed
+                                               anchor='center',
+                                               size=(deg2pix(self.s('widthDeg')), deg2pix(self.s('heightDeg'))),
+                                               max_alpha=1.0,
+                                               mipmaps_enabled=False,
+                                               texture_min_filter=gl.GL_NEAREST,
+                                               texture_mag_filter=gl.GL_NEAREST,
+                                               on=False) # leave it off for now
+        self.tsp = self.texturestimulus.parameters # synonym
+        self.to = self.tsp.texture.get_texture_object()
+        self.buf = np.zeros(self.shape, dtype=np.uint8) # for inverted frames
+        self.frameid = None # (frame index, invert) of the frame last uploaded to the texture
+        self.stimuli = (self.texturestimulus,)
+        return self.stimuli
+
+    def updateparams(self, i, nvsyncs):
+        e = self.e # synonym
+        self.tsp.on = bool(self.d('on', i))
+        frameid = self.d('framei', i), self.d('invert', i)
+        if frameid != self.frameid:
+            frame = self.frames[self.d('framei', i)]
+            if self.d('invert', i):
+                frame = np.subtract(255, frame, self.buf) # give the frame inverted polarity
+            self.to.put_sub_image(frame, data_format=GLFORMATS[self.nchannels], data_type=gl.GL_UNSIGNED_BYTE)
+            self.frameid = frameid
+        self.tsp.angle = self.s('orioff') + self.d('ori', i)
+        self.tsp.position = e.xorig+deg2pix(self.d('xposDeg', i)), e.yorig+deg2pix(self.d('yposDeg', i))
+        return []
+
+
+class Composite(Experiment):
+    """Composite experiment, displays several Components at once. All Components are updated
+    together at the start of each sweep. Only params that actually change from one vsync to
+    the next, like the position of a moving bar or the phase of a drifting grating, are pushed
+    on every vsync, from values computed for the whole sweep in advance, in one pass over a
+    flat list. Stationary and flashed Components cost nothing per vsync"""
+    def __init__(self, script, static, dynamic, variables, components, runs=None, blanksweeps=None):
+        super(Composite, self).__init__(script, static, dynamic, variables, runs=runs, blanksweeps=blanksweeps)
+        self.components = components
+
+    def check(self):
+        """Check Composite-specific parameters"""
+        names = [ component.name for component in self.components ]
+        assert len(set(names)) == len(names), 'Component names must be unique: %r' % names
+        for component in self.components: # sets defaults, so do this first
+            component.check(self)
+        super(Composite, self).check()
+
+    def build(self):
+        """Builds the SweepTable and the Header for this Experiment, and its Components"""
+        super(Composite, self).build()
+        for component in self.components:
+            component.build()
+
+    def createstimuli(self):
+        """Creates the VisionEgg stimuli objects for this Experiment subclass"""
+        super(Composite, self).createstimuli()
+        stimuli = []
+        for component in self.components:
+            stimuli.extend(component.createstimuli())
+        self.stimuli = (self.background,) + tuple(stimuli) # last entry will be topmost layer in viewport
+        self.pushes = [] # per-vsync param updates for the current sweep
+
+    def updateparams(self, i):
+        """Updates stimulus parameters, given sweep table index i"""
+        if i == None: # do a blank sweep
+            for component in self.components:
+                component.off() # leave all other parameters unchanged
+            self.pushes = []
+            self.postval = self.blankpostval # posted to DT port to indicate a blank sweep
+            self.nvsyncs = sec2intvsync(self.blanksweeps.sec) # this many vsyncs for this sweep
+            self.npostvsyncs = 0 # this many post-sweep vsyncs for this sweep, blank sweeps have no post-sweep delay
+        else: # not a blank sweep
+            self.postval = i # sweep table index will be posted to DT port
+            self.nvsyncs = sec2intvsync(self.st.sweepSec[i]) # this many vsyncs for this sweep
+            self.npostvsyncs = sec2intvsync(self.st.postsweepSec[i]) # this many post-sweep vsyncs for this sweep
+
+            self.pushes = []
+            for component in self.components:
+                self.pushes.extend(component.updateparams(i, self.nvsyncs))
+
+            # Update background parameters
+            self.bgp.color = self.st.bgbrightness[i], self.st.bgbrightness[i], self.st.bgbrightness[i], 1.0
+
+    def main(self):
+        """Run the main stimulus loop for this Experiment subclass"""
+        for ii, i in enumerate(self.sweeptable.i):
+
+            if ii < self.startii:
+                continue # already displayed before being interrupted, see Resume.py
+            self.sweepii = ii # current position in the sweep sequence
+            self.updateparams(i)
+
+            # Set sweep bit high, do the sweep
+            vsynci = 0 # always display and post the first vsync, even of a late sweep, see skip()
+            while vsynci < self.nvsyncs: # nvsyncs depends on if this is a blank sweep or not
+                if self.input.poll(): # ESC has been hit
+                    self.quit = True
+                if self.quit:
+                    break # out of vsync loop
+                for params, name, vals in self.pushes: # only params that change every vsync
+                    setattr(params, name, vals[vsynci])
+                if I.DTBOARDINSTALLED: self.postInt(self.postval) # post value to port
+                self.screen.clear()
+                self.viewport.draw()
+                ve.Core.swap_buffers() # returns immediately
+                gl.glFlush() # waits for next vsync pulse from video card
+                self.vsynctimer.tick()
+                self.nvsyncsdisplayed += 1 # increment
+                vsynci = self.skip(vsynci + 1, self.nvsyncs)
+
+            # Sweep's done, turn off all the Components, do the postsweep delay, clear sweep bit low
+            for component in self.components:
+                component.off()
+            self.staticscreen(nvsyncs=self.npostvsyncs) # clears sweep bit low when done
+
+            if self.quit:
+                self.ii = ii + 1 - 1 # dec for accurate count of nsweeps successfully displayed
+                break # out of sweep loop
+
+            self.checkpoint(ii + 1) # save progress every so often
+
+        self.ii = ii + 1 # nsweeps successfully displayed
@@ -25,6 +25,11 @@ MAXPOSTABLEINT = 0x0000ffff
 NAN = 0x7fffffff
 # RECORD bit, +ve edge triggers acquisition to start saving data:
 RECORD = 0x00010000
+# Maximum postable integer when posting on 20 digital lines, ~1 million. These correspond to
+# Ports A and B, and lines 0 to 3 of Port C on the DT340 (see DT.c):
+MAXPOSTABLEINT20 = 0x000fffff
+# RECORD bit when posting on 20 digital lines, moved up to Port C line 4, just above the data lines:
+RECORD20 = 0x00100000
 
 
 class DimstimConfigParser(ConfigParser.RawConfigParser):
@@ -228,6 +233,7 @@ I.DTBOARDINSTALLED = dc.get('DTBoard', 'installed') # boolean
 I.SCREENWIDTHCM = float(dc.get('Screen', 'width')) # cm
 I.SCREENHEIGHTCM = float(dc.get('Screen', 'height')) # cm
 I.SCREENDISTANCECM = float(dc.get('Screen', 'distance')) # cm
+I.REDRAWSTATIC = dc.get('Screen', 'redrawstatic') # boolean
 I.SCREENWIDTH = vc.VISIONEGG_SCREEN_W # pix
 I.SCREENHEIGHT = vc.VISIONEGG_SCREEN_H # pix
 I.REFRESHRATE = float(vc.VISIONEGG_MONITOR_REFRESH_HZ) # Hz
@@ -238,5 +244,7 @@ if not vc.VISIONEGG_GAMMA_INVERT_RED == vc.VISIONEGG_GAMMA_INVERT_GREEN == vc.VI
     raise ValueError('Gamma correction values for red, green, and blue are not equal')
 EYESTATES = ['left', 'right', 'both', None]
 I.EYE = dc.get('Eye', 'open') # eye open state
+I.TELEMETRY = dc.get('Telemetry', 'address') # (host, port) or None
+I.CONTROL = dc.get('Control', 'address') # (host, port) or None
 assert I.EYE in EYESTATES
 I.check()
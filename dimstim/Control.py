@@ -0,0 +1,135 @@
+"""Local control server, for queueing Experiment scripts in a running Session, checking on its
+progress, and adjusting ManBar and ManGrating params on the fly. Set address under [Control]
+in dimstim.cfg to enable it. The protocol is one JSON object per line, each answered by a
+line with a JSON object that has an 'ok' field, and an 'error' field if it isn't ok:
+
+    {"cmd": "status"}                       progress of whatever's running
+    {"cmd": "enqueue", "script": "bar.py"}  add a script to the end of a Session's queue
+    {"cmd": "set", "params": {"ori": 45}}   set ManBar or ManGrating params
+    {"cmd": "quit"}                         same as hitting ESC
+
+Requests are served in a background thread. Commands that change what's displayed are left
+in the target's mailbox, a deque that the render loop drains between vsyncs, so nothing is
+ever changed mid-frame, and nothing the render loop does waits on a lock. From the command line:
+
+>>> python -m dimstim.Control host:port status
+>>> python -m dimstim.Control host:port enqueue script.py
+>>> python -m dimstim.Control host:port set ori=45 widthDeg=2
+>>> python -m dimstim.Control host:port quit
+
+This module only uses the standard library, so the client can be run straight from this file,
+without installing dimstim or VisionEgg"""
+
+from __future__ import division
+
+import os
+import sys
+import socket
+import threading
+import SocketServer
+try:
+    import json # only available in Python >= 2.6
+except ImportError:
+    import simplejson as json
+
+
+def errorstring(err):
+    """Return a one line description of exception err"""
+    return '%s: %s' % (type(err).__name__, str(err).replace('\n', ' '))
+
+
+class Handler(SocketServer.StreamRequestHandler):
+    """Handles one client connection, one request per line"""
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line: # client hung up
+                break
+            if not line.strip():
+                continue
+            reply = self.server.control.execute(line)
+            self.wfile.write(json.dumps(reply) + '\n')
+
+
+class TCPServer(SocketServer.ThreadingTCPServer):
+    daemon_threads = True # don't hang on exit waiting for clients to hang up
+    allow_reuse_address = True
+
+
+class Server(threading.Thread):
+    """Serves control requests on address (host, port) in a background thread, on behalf of
+    target, a Session, ManBar or ManGrating. target is expected to have a status() method,
+    and a post() method that takes requests meant for its render loop. A Session also has an
+    enqueue() method"""
+    def __init__(self, address, target):
+        threading.Thread.__init__(self)
+        self.setDaemon(True) # don't hang on exit if the server is never closed
+        self.target = target
+        self.server = TCPServer(address, Handler)
+        self.server.control = self # so Handler can get at execute()
+
+    def run(self):
+        self.server.serve_forever()
+
+    def execute(self, line):
+        """Execute the request in line, return the reply as a dict"""
+        try:
+            request = json.loads(line)
+            cmd = request['cmd']
+            if cmd == 'status':
+                return {'ok': True, 'status': self.target.status()}
+            elif cmd == 'enqueue':
+                if not hasattr(self.target, 'enqueue'):
+                    raise ValueError, "%s can't queue scripts" % type(self.target).__name__
+                self.target.enqueue(request['script'])
+            elif cmd in ['set', 'quit']:
+                self.target.post(request) # left for the render loop
+            else:
+                raise ValueError, 'unknown command %r' % cmd
+            return {'ok': True}
+        except Exception, err:
+            return {'ok': False, 'error': errorstring(err)}
+
+    def close(self):
+        """Stop serving requests"""
+        if hasattr(self.server, 'shutdown'): # only available in Python >= 2.6
+            self.server.shutdown()
+        self.server.server_close()
+
+
+def send(address, request):
+    """Send request dict to the control server at address (host, port), return its reply"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    f = sock.makefile('r+')
+    f.write(json.dumps(request) + '\n')
+    f.flush()
+    reply = json.loads(f.readline())
+    f.close()
+    sock.close()
+    return reply
+
+def parseaddress(s):
+    """Parse 'host:port' into an address tuple"""
+    host, port = s.rsplit(':', 1)
+    return host, int(port)
+
+def parseval(s):
+    """Parse a command line param value as JSON if possible, otherwise leave it as a string"""
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s
+
+
+if __name__ == '__main__':
+    address, cmd, args = parseaddress(sys.argv[1]), sys.argv[2], sys.argv[3:]
+    request = {'cmd': cmd}
+    if cmd == 'enqueue':
+        request['script'] = os.path.abspath(args[0]) # the server's working dir may differ
+    elif cmd == 'set':
+        request['params'] = dict([ (name, parseval(val)) for name, val in
+                                   [ arg.split('=', 1) for arg in args ] ])
+    reply = send(address, request)
+    print json.dumps(reply, indent=4, sort_keys=True)
+    sys.exit(not reply['ok'])
@@ -0,0 +1,219 @@
+"""Convert natural movies to dimstim's movie file format, see Movie.py. Frames are read from an
+image sequence (a glob pattern or a list of image files, played in sorted order) or from a
+.npy stack of frames, and are cropped, greyscaled, resized and quantized to uint8 in a pool of
+processes, a chunk of frames per task. Converted frames are streamed to disk in order, with
+only so many chunks in flight at a time, so memory use doesn't depend on the movie's length.
+
+A 'movie' header can only count up to 2**16 - 1 frames. Longer movies must be converted to a
+chunked movie, a numbered series of movie files of at most that many frames each, played back
+as a Movie playlist. All files of a chunked movie are the same length, the last one padded
+with mid grey frames if need be, so the whole movie can be played straight through with a
+moviei by framei product of Variables. Either way, an index file is written next to the
+output, with the movie file names, their length and the padding. loadindex() returns the
+file names, ready for static.fname. From the command line:
+
+>>> python -m dimstim.Convert "frames/*.png" out.movie 64 64
+>>> python -m dimstim.Convert clip.npy out.movie 64 64 --chunked --crop=80,0,560,480
+"""
+
+from __future__ import division
+
+import os
+import sys
+import glob
+import struct
+import itertools
+import threading
+try:
+    import multiprocessing # only available in Python >= 2.6
+except ImportError:
+    multiprocessing = None
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+import numpy as np
+
+import Constants as C
+
+printer = C.printer # synonym
+info = printer.info
+
+MAXNFRAMES = 2**16 - 1 # most frames a movie file header can count, 0 is reserved for 2**16
+PADVAL = 128 # mid grey, for padding the last file of a chunked movie
+CHUNKSIZE = 64 # frames converted per task
+NCHUNKSPERPROCESS = 4 # chunks in flight per process, bounds memory use
+
+_stacks = {} # .npy stacks opened so far by this process, indexed by file name
+
+
+def getframes(source):
+    """Return the list of image file names, or the .npy stack, that source refers to"""
+    if type(source) in (list, tuple):
+        return list(source)
+    if source.endswith('.npy'):
+        if source not in _stacks: # open it only once per process
+            _stacks[source] = np.load(source, mmap_mode='r') # frames are read from disk as needed
+        return _stacks[source]
+    fnames = sorted(glob.glob(source))
+    if not fnames:
+        raise ValueError, 'no image files match %r' % source
+    return fnames
+
+def quantize(frame):
+    """Return frame as uint8. Floats are taken to range from 0 to 1, ints from 0 to 255"""
+    if frame.dtype == np.uint8:
+        return frame
+    if frame.dtype.kind == 'f':
+        frame = frame * 255
+    return np.uint8(np.round(np.clip(frame, 0, 255)))
+
+def convertframe(frame, ncellswide, ncellshigh, crop=None, colour=False):
+    """Convert frame, an image file name or an array, to a uint8 array ncellshigh by
+    ncellswide cells in size. crop is an optional (left, top, right, bottom) box in source
+    pixels. The frame is greyscaled, unless colour, in which case it's RGB"""
+    if type(frame) == str:
+        im = Image.open(frame)
+    else:
+        im = Image.fromarray(quantize(np.asarray(frame)))
+    if crop:
+        im = im.crop(crop)
+    im = im.convert({False: 'L', True: 'RGB'}[bool(colour)])
+    im = im.resize((ncellswide, ncellshigh), Image.ANTIALIAS)
+    return np.asarray(im, dtype=np.uint8)
+
+def convertchunk(args):
+    """Convert frames framei0 up to framei1 of source, a list of image file names or a .npy
+    file. Return them as a string of bytes, in movie file order. Runs in a worker process"""
+    source, framei0, framei1, ncellswide, ncellshigh, crop, colour = args
+    frames = getframes(source)
+    chunk = [ convertframe(frames[framei], ncellswide, ncellshigh, crop=crop, colour=colour)
+              for framei in xrange(framei0, framei1) ]
+    return np.asarray(chunk, dtype=np.uint8).tostring()
+
+def writeheader(f, ncellswide, ncellshigh, nframes, nchannels=1):
+    """Write a movie file header to open file f, see Movie.readheader()"""
+    assert nframes <= MAXNFRAMES, 'movie file header can count at most %d frames' % MAXNFRAMES
+    if nchannels == 1:
+        f.write('movie')
+    else:
+        f.write('movic') # colour movie
+    f.write(struct.pack('HHH', ncellswide, ncellshigh, nframes)) # 'H'== unsigned short int
+    if nchannels != 1:
+        f.write(struct.pack('H', nchannels))
+
+def chunkfnames(fname, nfiles):
+    """Return the file names of the files of a chunked movie"""
+    root, ext = os.path.splitext(fname)
+    return [ '%s_%03d%s' % (root, filei, ext) for filei in range(nfiles) ]
+
+def convert(source, fname, ncellswide, ncellshigh, crop=None, colour=False, chunked=False,
+            nprocesses=None, chunksize=CHUNKSIZE):
+    """Convert the movie in source, an image file glob pattern, a list of image files, or a
+    .npy file, to a movie file fname, ncellswide by ncellshigh cells in size. If chunked, write
+    a numbered series of movie files of up to MAXNFRAMES frames each instead. Also write an
+    index file, fname + '.index', see loadindex(). Frames are converted in parallel in
+    nprocesses processes, which defaults to the number of CPUs. Return the index"""
+    if type(source) == str:
+        source = os.path.abspath(source) # in case the workers' working dir differs
+    frames = getframes(source) # glob only once
+    nframes = len(frames)
+    if not chunked and nframes > MAXNFRAMES:
+        raise ValueError, '%r has %d frames, more than fit in one movie file. Convert it to a chunked movie' % (source, nframes)
+    nchannels = {False: 1, True: 3}[bool(colour)]
+    framesize = ncellswide*ncellshigh*nchannels
+    if chunked:
+        nfiles = int(np.ceil(nframes / MAXNFRAMES))
+        fnames = chunkfnames(fname, nfiles)
+    else:
+        nfiles = 1
+        fnames = [fname]
+    filelen = int(np.ceil(nframes / nfiles)) # frames per file, all files are the same length
+    npad = nfiles*filelen - nframes # padding frames at the end of the last file
+    # (file name, first frame, end frame) for each file:
+    files = [ (moviefname, filei*filelen, min((filei+1)*filelen, nframes))
+              for filei, moviefname in enumerate(fnames) ]
+    tasks = []
+    for moviefname, start, end in files:
+        for framei0 in range(start, end, chunksize): # tasks never straddle two files
+            framei1 = min(framei0+chunksize, end)
+            if type(frames) == list: # image file names, pass each task only its own
+                task = (frames[framei0:framei1], 0, framei1-framei0)
+            else: # .npy stack, memory-mapped once per worker, see getframes()
+                task = (source, framei0, framei1)
+            tasks.append(task + (ncellswide, ncellshigh, crop, colour))
+
+    if multiprocessing and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=nprocesses)
+        nprocesses = nprocesses or multiprocessing.cpu_count()
+        inflight = threading.Semaphore(nprocesses*NCHUNKSPERPROCESS)
+        def throttled(tasks): # pool takes tasks as fast as they're yielded, hold it back
+            for task in tasks:
+                inflight.acquire() # released once its chunk is written
+                yield task
+        chunks = pool.imap(convertchunk, throttled(tasks)) # preserves order
+    else:
+        pool = None
+        inflight = None
+        chunks = itertools.imap(convertchunk, tasks)
+
+    framei = 0
+    for moviefname, start, end in files:
+        f = open(moviefname, 'wb')
+        writeheader(f, ncellswide, ncellshigh, filelen, nchannels)
+        while framei < end:
+            chunk = chunks.next()
+            f.write(chunk)
+            framei += len(chunk) // framesize
+            if inflight:
+                inflight.release()
+        if end-start < filelen: # last file, pad it
+            f.write(chr(PADVAL) * framesize * (filelen-(end-start)))
+        f.close()
+        info('Wrote frames %d to %d of %d to %s' % (start, end-1, nframes, moviefname))
+    if pool:
+        pool.close()
+        pool.join()
+
+    index = {'source': source,
+             'fnames': [ os.path.basename(moviefname) for moviefname, start, end in files ], # relative to the index
+             'nframes': [ filelen ] * nfiles, # including padding
+             'npad': npad, # padding frames at the end of the last file
+             'nsourceframes': nframes,
+             'ncellswide': ncellswide,
+             'ncellshigh': ncellshigh,
+             'nchannels': nchannels,
+             'crop': crop}
+    f = open(fname + '.index', 'w')
+    f.write(repr(index))
+    f.close()
+    return index
+
+def loadindex(fname):
+    """Return the tuple of movie file names written by convert() to index file fname,
+    with full paths, ready to be used as a Movie's static.fname. All the files are nframes
+    long, as listed in the index, so frame framei of the original movie is frame
+    framei % nframes of movie framei // nframes. The last npad frames of the last movie
+    are padding"""
+    f = open(fname, 'r')
+    index = eval(f.read())
+    f.close()
+    path = os.path.dirname(fname)
+    return tuple([ os.path.join(path, moviefname) for moviefname in index['fnames'] ])
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog source fname ncellswide ncellshigh [options]')
+    parser.add_option('--crop', help='left,top,right,bottom box to crop from source frames (pix)')
+    parser.add_option('--colour', action='store_true', default=False, help='keep RGB colour')
+    parser.add_option('--chunked', action='store_true', default=False,
+                      help='write a series of movie files, for movies too long for one')
+    parser.add_option('--nprocesses', type='int', help='defaults to the number of CPUs')
+    options, args = parser.parse_args()
+    if len(args) != 4:
+        parser.error('need source, fname, ncellswide and ncellshigh')
+    crop = options.crop and tuple([ int(x) for x in options.crop.split(',') ])
+    convert(args[0], args[1], int(args[2]), int(args[3]), crop=crop, colour=options.colour,
+            chunked=options.chunked, nprocesses=options.nprocesses)
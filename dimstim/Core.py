@@ -36,8 +36,10 @@ import winsound
 
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
+from numpy.lib.stride_tricks import as_strided
 
 import Constants as C # keep namespace clean
+import Codec
 from Constants import NAN, TAB, I, dc # dc could be required in eval in TextHeader.build()
 
 if I.DTBOARDINSTALLED:
@@ -71,6 +73,15 @@ class StaticParams(dictattr):
         self.postexpSec = None
         # stimulus ori offset (deg)
         self.orioff = None
+        # number of digital lines used to post sweep table indices to acq, 16 or 20. 20 allows
+        # for ~1 million sweep table entries, which are then computed on demand (see StreamingSweepTable)
+        self.dinbits = 16
+        # seed for shuffling and randomizing. If left as None, a seed is picked at random. Either
+        # way, it's saved in the text header, so the realised sweep order can be regenerated
+        self.seed = None
+        # lock the stimulus to the clock: after a dropped vsync, skip ahead by the number of
+        # vsyncs missed, instead of running late from then on. Skipped vsyncs are logged
+        self.timelocked = False
     def check(self):
         for paramname, paramval in self.items():
             assert not iterable(paramval) or paramval.__class__ in (str, tuple), 'static parameter must be a scalar: %s = %r' % (paramname, paramval) # can't be an iterable object, unless it's a string or a tuple
@@ -181,6 +192,31 @@ class BlankSweeps(object):
         assert self.T.__class__ == int and self.T >= 2, 'blank sweeps period must be an integer >= 2'
 
 
+class RNG(object):
+    """A seeded random number generator, one per Experiment. All shuffling and randomizing for
+    an Experiment draws from it, so the realised sweep order can be regenerated bit for bit
+    from the seed"""
+    def __init__(self, seed=None):
+        if seed == None:
+            seed = np.random.RandomState().randint(2**31) # RandomState() seeds itself from the OS
+        self.seed = int(seed)
+        self.state = np.random.RandomState(self.seed)
+    def shuffle(self, seq):
+        """Return a shuffled (without replacement) copy of seq, as an array if seq is one,
+        otherwise as a list"""
+        return self.take(seq, self.state.permutation(len(seq)))
+    def randomize(self, seq):
+        """Return a randomized (with replacement) sequence sampled from (and of the same length as) seq,
+        as an array if seq is one, otherwise as a list"""
+        n = len(seq)
+        return self.take(seq, self.state.randint(n, size=n)) # random ints from 0 to n-1
+    def take(self, seq, i):
+        """Return the entries of seq at indices i, as an array if seq is one, otherwise as a list"""
+        if seq.__class__ == np.ndarray:
+            return seq[i]
+        return list(np.asarray(seq)[i])
+
+
 class SweepTable(object):
     """A SweepTable holds all unique combinations of Experiment Variables, as well as indices
     into these combinations, based on shuffle/random flags for each Dimension, the number of runs,
@@ -227,11 +263,12 @@ class SweepTable(object):
         for varname in self.data:
             assert len(self.data[varname]) == nvals, '%s length in sweep table does not match expected length %d' % (varname, nvals)
 
-        # For convenience in the main stimulus loop, add the non-varying dynamic params to self.data
+        # For convenience in the main stimulus loop, add the non-varying dynamic params to self.data.
+        # These are read-only constant arrays that take up the memory of a single value
         nvals = max(nvals, 1) # make sure the sweep table has at least one entry
         for paramname, paramval in e.dynamic.iteritems():
             if paramname not in self.data:
-                self.data[paramname] = np.tile(paramval, nvals) # paramval was already checked to be a scalar in Experiment.check()
+                self.data[paramname] = constarray(paramval, nvals) # paramval was already checked to be a scalar in Experiment.check()
 
         # Do the Dimension shuffling/randomizing by generating appropriate sweep table indices
         self.i = self.geti() # get 1 Run's worth of sweep table indices, shuffling/randomizing variables that need it
@@ -251,7 +288,7 @@ class SweepTable(object):
 
             if e.blanksweeps.shuffle:
                 samplespace = range(nsweeps + len(insertioni)) # range of possible indices to insert at
-                np.random.shuffle(samplespace) # shuffle them in place
+                samplespace = e.rng.shuffle(samplespace)
                 insertioni = samplespace[:len(insertioni)] # pick the fist len(insertioni) entries in samplespace
                 insertioni.sort() # make sure we insert in order, don't try inserting at indices that don't exist yet
 
@@ -288,46 +325,37 @@ class SweepTable(object):
             d.check() # make sure everything is consistent in this Dimension
 
     def builddimitable(self):
-        """Build the dimension index table"""
-        # Can't figure out how to use a recursive generator/function to do this, see Apress Beginning Python p192
-        # HACK!!: generate and exec the appropriate Python code to build the ordered (unshuffled/unrandomized) dimension index table
-        dimi = [None]*len(self.dimensions) # stores the index we're currently on in each dimension
-        self.dimitable = [] # ordered dimension index table, these are indices into the values in dimensions, dimensions are in columns, sweeps are in rows
-        # generate code with the right number of nested for loops
-        code = ''
-        tabs = ''
-        for dimension in self.dimensions: # generate ndim nested for loops...
-            i = str(dimension.dim)
-            code += tabs+'for dimi['+i+'] in range(len(self.dimensions['+i+'])):\n'
-            tabs += TAB # add a tab to tabs in preparation for the next for loop, or the innermost part of the last one
-        code += tabs+'self.dimitable.append(copy(dimi))\n' # innermost part of the nested for loops, copying dimi is important
-        exec(code) # run the generated code, this builds the ordered dimitable with all the permutations
-        '''
-        # example of what the generated code looks like for 3 dimensions:
-        for dimi[0] in range(len(self.dimensions[0])):
-            for dimi[1] in range(len(self.dimensions[1])):
-                for dimi[2] in range(len(self.dimensions[2])):
-                    self.dimitable.append(copy(dimi))
-        '''
-        self.dimitable = np.asarray(self.dimitable)
+        """Build the dimension index table, with dimensions in columns and sweeps in rows.
+        Equivalent to ndims nested for loops over the length of each dimension, with dim 0 as
+        the outermost loop. The table is stored using the smallest unsigned int type that fits"""
+        shape = [ len(dimension) for dimension in self.dimensions ]
+        nsweeps = int(np.prod(shape)) # 1 if there are no dimensions
+        if max(shape + [0]) <= 2**16:
+            dtype = np.uint16
+        else:
+            dtype = np.uint32
+        # np.indices varies the last dimension fastest, same order as the nested for loops:
+        self.dimitable = np.indices(shape, dtype=dtype).reshape(len(shape), nsweeps).T
+        self.nconditions = nsweeps
         self.checkdimitable()
 
     def checkdimitable(self):
         """Check the length of the dimitable"""
         nsweeps = len(self.dimitable)
         if nsweeps > C.MAXPOSTABLEINT:
-            raise ValueError, 'sweep table has %d sweeps, with indices exceeding the maximum index %d that can be sent to acq (index %d is reserved to signify a blank sweep). Reduce the number of dimensions or conditions' % (nsweeps, C.MAXPOSTABLEINT-1, C.MAXPOSTABLEINT)
+            raise ValueError, 'sweep table has %d sweeps, with indices exceeding the maximum index %d that can be sent to acq (index %d is reserved to signify a blank sweep). Reduce the number of dimensions or conditions, or set static parameter dinbits = 20 to post up to %d sweep table indices on 20 digital lines' % (nsweeps, C.MAXPOSTABLEINT-1, C.MAXPOSTABLEINT, C.MAXPOSTABLEINT20)
 
     def geti(self):
         """Return one Run's worth of sweep table indices, in a numpy array.
         Takes into account the state of each Dimension's shuffle and random flags"""
+        e = self.experiment # synonym
         i = np.arange(len(self.dimitable)) # set of indices into the sweep table, stores in what order and the # of times and we'll be stepping through the sweeptable during the experiment
 
         # check if all dims are set to be shuffled/randomized, if so, do it the fast way
         if np.all([ dim.shuffle for dim in self.dimensions ]): # all dimensions are set to be shuffled
-            i = shuffle(i) # shuffle all of the indices at once
+            i = e.rng.shuffle(i) # shuffle all of the indices at once
         elif np.all([ dim.random for dim in self.dimensions ]): # all dimensions are set to be randomized
-            i = randomize(i) # randomize all of the indices at once
+            i = e.rng.randomize(i) # randomize all of the indices at once
         else: # shuffle/randomize each dim individually (slower)
             for dim in self.dimensions:
                 if dim.shuffle or dim.random: # if flag is set to shuffle or randomize
@@ -343,9 +371,9 @@ class SweepTable(object):
                         # j is a collection of indices to shuffle over, made up of every offset'th index, starting from segmenti
                         j = np.asarray([ j for j in range(segmenti, offset*len(dim), offset) ])
                         if dim.shuffle:
-                            newj = shuffle(j)
+                            newj = e.rng.shuffle(j)
                         elif dim.random:
-                            newj = randomize(j)
+                            newj = e.rng.randomize(j)
                         i[sortis[j]] = sortedi[newj] # update sweep table indices appropriately, this is the trickiest bit
         return i
 
@@ -380,6 +408,251 @@ class SweepTable(object):
                         f.write('%s\t' % self.data[var.name][ival]) # variable value at sweep table index
         return f.getvalue()
 
+    def asrecarray(self):
+        """Return the sweep table as a structured array, with one named column per dynamic param
+        (Variables and non-varying dynamic params alike) and one row per sweep table index.
+        Columns of Nones (or of numbers mixed with Nones) are stored as floats, with None as NaN"""
+        names = sorted(self.data.keys())
+        columns = []
+        for name in names:
+            col = np.asarray(self.data[name])
+            if col.dtype == object:
+                try:
+                    col = np.asarray([ np.nan if val == None else val for val in col ], dtype=np.float64)
+                except (TypeError, ValueError): # leave anything else as is
+                    pass
+            columns.append(col)
+        nrows = len(self.dimitable)
+        table = np.empty(nrows, dtype=[ (name, col.dtype) for name, col in zip(names, columns) ])
+        for name, col in zip(names, columns):
+            table[name] = col
+        return table
+
+    def getpostvals(self):
+        """Return the realised sweep table indices as an int array, with blank sweeps
+        as C.MAXPOSTABLEINT, same as the values posted to acq during the experiment"""
+        i = self.i
+        if i.dtype == object: # has blank sweeps
+            i = np.where(np.equal(i, None), C.MAXPOSTABLEINT, i)
+        return np.asarray(i, dtype=np.int32)
+
+    def iterchunks(self):
+        """Iterate over the realised sweep table indices in chunks, as int arrays with blank sweeps
+        as -1. Here there's only a single chunk, since the indices are all in memory anyway"""
+        i = self.i
+        if i.dtype == object: # has blank sweeps
+            i = np.where(np.equal(i, None), -1, i)
+        yield np.asarray(i, dtype=np.int64)
+
+    def save(self, fname):
+        """Save the sweep table to a binary .npz file for analysis. Holds the structured array
+        returned by asrecarray() as 'data', the realised sweep table indices as 'i' (see
+        getpostvals()), the Variable names as 'varnames', and the dimension index table as
+        'dimitable', and the random seed as 'seed'. Load it with np.load(fname), no need to
+        execute the script or import VisionEgg"""
+        varnames = [ var.name for dim in self.dimensions for var in dim.variables ]
+        np.savez(fname, data=self.asrecarray(), i=self.getpostvals(),
+                 varnames=np.asarray(varnames, dtype=str), dimitable=self.dimitable,
+                 seed=np.int64(self.experiment.rng.seed))
+
+
+class StreamingSweepTable(SweepTable):
+    """A SweepTable for experiments with more conditions than fit in memory, or than can be
+    posted to acq on 16 digital lines. Neither the dimension index table, the sweep table columns
+    nor the realised sweep table indices are ever materialized. Variable values for sweep table
+    index i are computed on demand by mixed-radix decoding of i, with the Dimension lengths as
+    the radices. Realised sweep table indices are generated a chunk at a time. Shuffling and
+    randomizing use seeded pseudorandom permutations and hashes of the sweep's position, so any
+    chunk can be regenerated at any time, in constant memory"""
+    chunksize = 2**16 # number of sweep table indices generated at a time
+    BLANKTAG = 2**32 # key tag for shuffled blank sweeps, distinct from all run indices
+
+    def build(self):
+        """Build the streaming sweep table. Same Variable dim and flag semantics as SweepTable.build()"""
+        e = self.experiment # synonym
+
+        self.builddimensions()
+        self.shape = [ len(dimension) for dimension in self.dimensions ]
+        self.nconditions = int(np.prod(self.shape)) # 1 if there are no dimensions
+        self.checkdimitable()
+        # number of sweep table entries between successive values of each dimension, dim 0 varies slowest:
+        self.strides = [ int(np.prod(self.shape[dim+1:])) for dim in range(len(self.shape)) ]
+
+        self.data = dictattr()
+        for dim in self.dimensions:
+            for var in dim.variables:
+                self.data[var.name] = LazyColumn(var.vals, self.strides[dim.dim], self.nconditions)
+        for paramname, paramval in e.dynamic.iteritems():
+            if paramname not in self.data:
+                self.data[paramname] = constarray(paramval, self.nconditions)
+
+        self.seed = e.rng.seed # all shuffling and randomizing is derived from this
+        if e.runs:
+            self.nruns, self.reshuffle = e.runs.n, e.runs.reshuffle
+        else:
+            self.nruns, self.reshuffle = 1, False
+        self.nsweeps = self.nconditions * self.nruns # excluding blank sweeps
+        if e.blanksweeps: # same number of blank sweeps as SweepTable.build() inserts
+            self.nblanksweeps = len(xrange(e.blanksweeps.T-1, self.nsweeps, e.blanksweeps.T-1))
+        else:
+            self.nblanksweeps = 0
+        self.i = StreamingIndices(self)
+        if e.dryrun: # only worth the time when validating
+            self.checkruns()
+
+    def checkdimitable(self):
+        """Check the number of conditions"""
+        if self.nconditions > C.MAXPOSTABLEINT20:
+            raise ValueError, 'sweep table has %d sweeps, with indices exceeding the maximum index %d that can be sent to acq on 20 digital lines (index %d is reserved to signify a blank sweep). Reduce the number of dimensions or conditions' % (self.nconditions, C.MAXPOSTABLEINT20-1, C.MAXPOSTABLEINT20)
+
+    def key(self, tag):
+        """Return the pseudorandom key for tag (run index, or BLANKTAG), derived from the seed"""
+        return hashint(tag, self.seed)
+
+    def isblank(self, q):
+        """Return a bool array, True where positions q in the realised sweep sequence are blank sweeps"""
+        if not self.nblanksweeps:
+            return np.zeros(len(q), dtype=bool)
+        e = self.experiment # synonym
+        if e.blanksweeps.shuffle: # choose nblanksweeps positions out of all of them, without replacement
+            ntotal = self.nsweeps + self.nblanksweeps
+            return permute(q, ntotal, self.key(self.BLANKTAG)) < self.nblanksweeps
+        T = e.blanksweeps.T
+        return ((q+1) % T == 0) & ((q+1) // T <= self.nblanksweeps) # every T'th position
+
+    def getconditions(self, s):
+        """Return the sweep table indices for non-blank sweep numbers s, taking into account each
+        Dimension's shuffle and random flags, and whether Runs are reshuffled"""
+        k = s % self.nconditions # position within its run
+        runi = s // self.nconditions
+        if not self.reshuffle:
+            runi = np.zeros_like(runi) # all runs are the same
+        key = self.key(runi) # one key per run
+        if not self.dimensions:
+            return k
+        if np.all([ dim.shuffle for dim in self.dimensions ]): # shuffle all of the indices at once
+            return permute(k, self.nconditions, key)
+        elif np.all([ dim.random for dim in self.dimensions ]): # randomize all of the indices at once
+            return (hashint(k, key) % np.uint64(self.nconditions)).astype(np.int64)
+        i = np.zeros(len(k), dtype=np.int64)
+        for dim in self.dimensions: # shuffle/randomize each dim individually, slowest first
+            stride, n = self.strides[dim.dim], len(dim)
+            digit = k // stride % n # index into the values of this dimension
+            dimkey = hashint(dim.dim, key)
+            if dim.shuffle: # shuffle within each segment in which only this dimension varies
+                # the segment is identified by the final digits of the slower dimensions, and
+                # the unshuffled digits of the faster ones. Both are known when undoing the
+                # shuffles fastest dimension first, so the result is a permutation of k
+                segment = i + k % stride
+                digit = permute(digit, n, hashint(segment, dimkey))
+            elif dim.random:
+                digit = (hashint(k, dimkey) % np.uint64(n)).astype(np.int64)
+            i += digit * stride
+        return i
+
+    def checkruns(self):
+        """Check that every run is a permutation of all the sweep table indices, unless some
+        Dimension is randomized, in which case conditions can repeat by design"""
+        if np.any([ dim.random for dim in self.dimensions ]):
+            return
+        nruns = {False: 1, True: self.nruns}[bool(self.reshuffle)] # runs differ only if reshuffled
+        for runi in xrange(nruns):
+            s = np.arange(runi*self.nconditions, (runi+1)*self.nconditions, dtype=np.int64)
+            i = np.sort(self.getconditions(s))
+            assert (i == np.arange(self.nconditions)).all(), 'run %d of the sweep table is not a permutation of its %d conditions' % (runi, self.nconditions)
+
+    def iterchunks(self):
+        """Iterate over the realised sweep table indices in chunks, as int arrays with blank sweeps as -1"""
+        ntotal = self.nsweeps + self.nblanksweeps
+        nsweepsdone = 0 # number of non-blank sweeps generated so far
+        for start in xrange(0, ntotal, self.chunksize):
+            q = np.arange(start, min(start+self.chunksize, ntotal), dtype=np.int64) # positions in sequence
+            blank = self.isblank(q)
+            notblank = ~blank
+            s = nsweepsdone + np.cumsum(notblank)[notblank] - 1 # non-blank sweep numbers
+            nsweepsdone += len(s)
+            chunk = np.empty(len(q), dtype=np.int64)
+            chunk[blank] = -1
+            chunk[notblank] = self.getconditions(s)
+            yield chunk
+
+    def getpostvals(self):
+        """Return the realised sweep table indices as an int array, with blank sweeps
+        as C.MAXPOSTABLEINT20, same as the values posted to acq during the experiment"""
+        return np.concatenate([ np.where(chunk == -1, C.MAXPOSTABLEINT20, chunk).astype(np.int32)
+                                for chunk in self.iterchunks() ])
+
+    def _pprint(self, i=None):
+        """Return a string representation of the sweep table at sweep table indices i.
+        If i is left as None, the first chunk's worth of the basic sorted sweep table is used"""
+        if i == None:
+            i = range(min(self.nconditions, self.chunksize))
+        return super(StreamingSweepTable, self)._pprint(i)
+
+    def save(self, fname):
+        """Save the sweep table to a binary .npz file for analysis. Instead of the full table,
+        this holds the Variable names as 'varnames', their values as 'vals_<varname>', their
+        dimension as 'vardims', the Dimension lengths as 'shape', and the seed as 'seed'. The
+        sweep table entry for index i is vals_<varname>[i // stride % len(vals_<varname>)],
+        where stride is the product of the lengths of the Dimensions that follow. The realised
+        sweep table indices, with blank sweeps as C.MAXPOSTABLEINT20, are written a chunk at a
+        time to a separate memory-mappable file, with .npz replaced by .i.npy"""
+        variables = [ var for dim in self.dimensions for var in dim.variables ]
+        vals = dict([ ('vals_'+var.name, np.asarray(var.vals)) for var in variables ])
+        np.savez(fname, varnames=np.asarray([ var.name for var in variables ], dtype=str),
+                 vardims=np.asarray([ var.dim for var in variables ], dtype=np.int32),
+                 shape=np.asarray(self.shape, dtype=np.int64), seed=np.int64(self.seed), **vals)
+        i = np.lib.format.open_memmap(os.path.splitext(fname)[0] + '.i.npy', mode='w+',
+                                      dtype=np.int32, shape=(len(self.i),))
+        start = 0
+        for chunk in self.iterchunks():
+            i[start:start+len(chunk)] = np.where(chunk == -1, C.MAXPOSTABLEINT20, chunk)
+            start += len(chunk)
+        del i # flush to disk
+
+
+class LazyColumn(object):
+    """A StreamingSweepTable column for a Variable. Values are computed on demand for any
+    sweep table index (or array of them), by mixed-radix decoding of the index"""
+    def __init__(self, vals, stride, n):
+        self.vals = np.asarray(vals)
+        self.stride = stride # product of the lengths of the Dimensions that vary faster than this one
+        self.n = n # number of sweep table entries
+    def __len__(self):
+        return self.n
+    def __getitem__(self, i):
+        return self.vals[i // self.stride % len(self.vals)]
+
+
+class StreamingIndices(object):
+    """The realised sweep table indices of a StreamingSweepTable, generated a chunk at a time
+    during iteration. Blank sweeps are None, same as for a SweepTable"""
+    def __init__(self, sweeptable):
+        self.sweeptable = sweeptable
+    def __len__(self):
+        return self.sweeptable.nsweeps + self.sweeptable.nblanksweeps
+    def __iter__(self):
+        for chunk in self.sweeptable.iterchunks():
+            for i in chunk.tolist():
+                if i == -1:
+                    yield None
+                else:
+                    yield i
+    def __getitem__(self, ii):
+        """Return the sweep table index at position ii. Generates all chunks up to ii's, so this
+        is only meant for the first few indices"""
+        if ii < 0:
+            ii += len(self)
+        if not 0 <= ii < len(self):
+            raise IndexError, 'sweep index %d out of range' % ii
+        for chunk in self.sweeptable.iterchunks():
+            if ii < len(chunk):
+                i = int(chunk[ii])
+                if i == -1:
+                    return None
+                return i
+            ii -= len(chunk)
+
 
 class Header(object):
     """Container for the text header. Formerly also held Surf and NVS headers"""
@@ -407,6 +680,7 @@ class TextHeader(object):
         sf.write('# Generated by dimstim on %s\n' % datetime.datetime.now()) # str converts datetime obj to string
         sf.write('__version__ = %r\n' % dimstim.__version__)
         sf.write('from dimstim.Constants import InternalParams\n') # import InternalParams into the text header's namespace
+        sf.write('from dimstim.Codec import rldecode, dvdecode\n') # decoders for compactly encoded int sequences
         sf.write('import datetime\n') # import datetime into text header's namespace
         sf.write('I = InternalParams()\n') # init an InternalParams object
         sf.write('I.DATETIME = %r\n' % datetime.datetime.now()) # repr leaves it as a datetime object
@@ -415,6 +689,10 @@ class TextHeader(object):
         for paramname, paramval in namevals:
             sf.write('I.%s = %r\n' % (paramname, paramval))
         sf.write('\n')
+        if e.resumeof: # reference the text header of the interrupted Experiment this one resumes
+            sf.write('RESUMEOF = %r\n' % e.resumeof)
+            sf.write('RESUMEII = %d # first position in its sweep sequence displayed here\n' % e.startii)
+            sf.write('\n')
 
         # add the script contents, replacing any lines with dc.get with the actual value, use re to match paramname = dc.get
         f = file(e.script, 'r') # script that defined the experiment
@@ -456,6 +734,8 @@ class TextHeader(object):
             spinstancematch = SPIRE.match(line) # returns a match object if there's a match
             if spinstancematch:
                 spobjname = spinstancematch.groupdict()['objname']
+                # record the actual seed, in case the script doesn't set it:
+                line = '%s%s.seed = %r # inserted by dimstim\n' % (line, spobjname, e.static.seed)
                 #exec(spobjname + ' = e.static') # e.g., set s = e.static, dangerous, but could be useful in an eval below
             dpinstancematch = DPIRE.match(line)
             if dpinstancematch:
@@ -486,7 +766,8 @@ class TextHeader(object):
                         if '.get(' not in paramval and np.asarray(evalparamval == evalactualparamval).all():
                             pass # don't replace paramval. Prevents from expanding say range(6000) into a massive string
                         else: # replace the paramval with the actualparamval by generating a complete line replacement
-                            replacement = '%s.%s = %s%s\n' % (objname, paramname, actualparamval, comment)
+                            # encode long int sequences (frame indices, etc.) compactly:
+                            replacement = '%s.%s = %s%s\n' % (objname, paramname, Codec.encode(evalactualparamval), comment)
                             self.printreplacementmsg(linei, line, replacement)
                             line = replacement
                 elif objname == vsobjname: # if we're on a line that assigns a Variable to the Variables instance
@@ -523,12 +804,59 @@ class TextHeader(object):
         print self.data.rstrip(' ')
 
 
+class LogHistogram(object):
+    """Fixed size histogram with logarithmically spaced bins (HDR histogram style), for intervals
+    of any length in sec. Each power of 2 us is split into 2**subbits linearly spaced bins, so
+    any value is counted to within a relative precision of 2**-subbits. Memory use is constant"""
+    def __init__(self, subbits=5, maxpow=32):
+        self.nsub = 2**subbits # number of bins per power of 2
+        self.maxpow = maxpow # values of 2**maxpow us (~70 min) and up all go in the last bin
+        self.counts = [0] * ((maxpow+1) * self.nsub)
+        self.n = 0
+    def add(self, sec):
+        """Count interval sec"""
+        m, e = math.frexp(sec * 1000000) # sec*1e6 = m * 2**e, 0.5 <= m < 1
+        if e < 0: # less than 1 us, or 0
+            index = 0
+        elif e > self.maxpow:
+            index = -1
+        else:
+            index = e * self.nsub + int((m - 0.5) * 2 * self.nsub)
+        self.counts[index] += 1
+        self.n += 1
+    def upper(self, index):
+        """Return the upper edge of bin index, in sec"""
+        e, sub = divmod(index, self.nsub)
+        return math.ldexp(0.5 + (sub + 1) / (2 * self.nsub), e) / 1000000
+    def percentile(self, p):
+        """Return the interval in sec that p percent of counted intervals fall at or below,
+        to within the bin precision. Return None if nothing has been counted"""
+        if self.n == 0:
+            return None
+        target = p / 100 * self.n
+        cum = 0
+        for index, count in enumerate(self.counts):
+            cum += count
+            if count and cum >= target:
+                return self.upper(index)
+        return self.upper(len(self.counts) - 1)
+
+
 class VsyncTimer(object):
     """Times vsyncs, stolen, modified, clarified from VisionEgg.Core.Frametimer.
     self.pprint() is visually more compact than log_histogram.
-    Return the histogram as a string, don't write to screen or log"""
+    Return the histogram as a string, don't write to screen or log.
+
+    In long session mode, for Experiments that can run for hours, memory use stays flat:
+    only the most recent maxdrops dropped vsyncs are kept (all drops are still counted), IVIs are
+    also counted in a LogHistogram for percentiles, and a summary is written to the log every
+    summarysec
+
+    In time-locked mode, vsyncs missed by drops are added up in self.nmissed, for the
+    Experiment to skip over (see Experiment.skip()), and skipped vsyncs are recorded in self.skips"""
     def __init__(self, leftbin=1, rightbin=22, binwidth=1, runavglen=0,
-                 dropthresh=1/I.REFRESHRATE*1.2):
+                 dropthresh=1/I.REFRESHRATE*1.2, longsession=False, maxdrops=1000,
+                 summarysec=600):
         self.bins = np.arange(leftbin, rightbin, binwidth)
         self.binwidth = float(binwidth)
         self.hist = [0]*len(self.bins) # timing histogram
@@ -542,6 +870,18 @@ class VsyncTimer(object):
         self.drops = [] # list of (index, time, interval) tuples of dropped vsyncs
         self.dropthresh = dropthresh
         self.n = 0 # vsync count
+        self.ndrops = 0 # dropped vsync count
+        self.nmissed = 0 # vsyncs missed by drops that haven't yet been skipped over
+        self.skips = [] # list of (index, time, nskipped) tuples of skips made up for drops
+        self.nskips = 0 # skip count
+        self.nskipped = 0 # skipped vsync count
+        self.telemetry = None # Telemetry.Publisher to report each IVI to, if any
+        self.longsession = longsession
+        if self.longsession:
+            self.maxdrops = maxdrops # self.drops is a ring buffer of this many entries
+            self.loghist = LogHistogram()
+            self.summarysec = summarysec
+            self.lastsummary = None # time of last summary written to log
 
     def tick(self):
         """Declare a vsync has just been drawn"""
@@ -549,9 +889,17 @@ class VsyncTimer(object):
         self.n += 1
         if self.last != None:
             IVI = now - self.last # most recent inter vsync interval
-            if IVI > self.dropthresh: # vsync has been dropped
+            dropped = IVI > self.dropthresh
+            if self.telemetry:
+                self.telemetry.tick(now, IVI, self.n-1, dropped)
+            if dropped: # vsync has been dropped
                 # use count - 1 to get 0-based index of vsync that was dropped"
-                self.drops.append((self.n-1, now, IVI))
+                if self.longsession and len(self.drops) == self.maxdrops: # overwrite the oldest
+                    self.drops[self.ndrops % self.maxdrops] = (self.n-1, now, IVI)
+                else:
+                    self.drops.append((self.n-1, now, IVI))
+                self.ndrops += 1
+                self.nmissed += max(intround(IVI*I.REFRESHRATE) - 1, 1)
                 # Generate system beep. cross-platform method is print '\a' # , but that's a
                 # long beep that creates lag:
                 winsound.Beep(4000, 1)
@@ -564,10 +912,51 @@ class VsyncTimer(object):
             if self.runavglen:
                 self.stack.append(now)
                 self.stack.pop(0)
+            if self.longsession:
+                self.loghist.add(IVI)
+                if now - self.lastsummary >= self.summarysec:
+                    info(self.summary(), toscreen=False)
+                    self.lastsummary = now
         else:
             self.first = now
+            if self.longsession:
+                self.lastsummary = now
         self.last = now # set for next vsync
 
+    def skip(self, n):
+        """Declare n vsyncs have been skipped over to make up for dropped ones"""
+        if self.longsession and len(self.skips) == self.maxdrops: # overwrite the oldest
+            self.skips[self.nskips % self.maxdrops] = (self.n, time.clock(), n)
+        else:
+            self.skips.append((self.n, time.clock(), n))
+        self.nskips += 1
+        self.nskipped += n
+        self.nmissed = max(self.nmissed - n, 0)
+
+    def percentile(self, p):
+        """Return the IVI in sec that p percent of IVIs fall at or below. Long session mode only"""
+        return self.loghist.percentile(p)
+
+    def summary(self):
+        """Return a one line summary of timing so far. Long session mode only"""
+        if self.loghist.n == 0:
+            return 'VsyncTimer: %d ticks recorded' % self.n
+        return ('VsyncTimer: %d ticks recorded over %s, %d dropped, (min, p50, p99, p99.9, max) IVI: '
+                '(%.2f, %.2f, %.2f, %.2f, %.2f) ms'
+                % (self.n, isotime(self.last - self.first, 0), self.ndrops, self.minIVI*1000,
+                   self.percentile(50)*1000, self.percentile(99)*1000, self.percentile(99.9)*1000,
+                   self.maxIVI*1000))
+
+    def stats(self):
+        """Return a dict of timing stats so far, IVIs in ms"""
+        stats = {'n': self.n, 'ndrops': self.ndrops, 'nskipped': self.nskipped,
+                 'minIVI': None, 'meanIVI': None, 'maxIVI': None}
+        if self.n > 1:
+            stats['minIVI'] = self.minIVI*1000
+            stats['meanIVI'] = (self.last - self.first) / (self.n-1) * 1000
+            stats['maxIVI'] = self.maxIVI*1000
+        return stats
+
     def avgIVI(self):
         """Get average IVI"""
         if self.last == None:
@@ -625,11 +1014,22 @@ class VsyncTimer(object):
                 cs = '+++ ' # count is too big to fit under the bin, print this instead
             ts += cs
         s.write(ts)
+        if self.longsession:
+            s.write('\n' + self.summary())
         if self.drops:
-            s.write('\nDropped vsyncs (IVI > %.2fms):' % (self.dropthresh*1000) + \
-                    '\nvsynci, t (s), IVI (ms)')
-            for vsynci, t, IVI in self.drops:
+            s.write('\nDropped vsyncs (IVI > %.2fms):' % (self.dropthresh*1000))
+            if self.ndrops > len(self.drops):
+                s.write(' %d in total, last %d shown' % (self.ndrops, len(self.drops)))
+            s.write('\nvsynci, t (s), IVI (ms)')
+            for vsynci, t, IVI in sorted(self.drops): # ring buffer may be out of order
                 s.write('\n%d, %.6f, %.2f' % (vsynci, t, IVI*1000))
+        if self.skips:
+            s.write('\nSkipped vsyncs (time-locked): %d in total' % self.nskipped)
+            if self.nskips > len(self.skips):
+                s.write(', last %d of %d skips shown' % (len(self.skips), self.nskips))
+            s.write('\nvsynci, t (s), nskipped')
+            for vsynci, t, n in sorted(self.skips):
+                s.write('\n%d, %.6f, %d' % (vsynci, t, n))
         return s.getvalue()
 
 
@@ -637,27 +1037,78 @@ def intround(n):
     """Round to the nearest integer, return an integer"""
     return int(round(n))
 
-def deg2pix(deg):
-    """Convert from degrees of visual space to pixels"""
+def floatarray(x):
+    """Return scalar or sequence x as a float array, with Nones replaced by 0,
+    and a bool array that's True wherever x was None"""
+    a = np.asarray(x)
+    if a.dtype == object:
+        isnone = np.asarray([ val == None for val in a.flat ], dtype=bool).reshape(a.shape)
+        a = np.where(isnone, 0, a)
+    else:
+        isnone = np.zeros(a.shape, dtype=bool)
+    return a.astype(np.float64), isnone
+
+def convresult(result, invalid, masked):
+    """Return the result of an array unit conversion, as a masked array (masked wherever
+    the input was invalid) if masked is set"""
+    if masked:
+        return np.ma.masked_array(result, mask=invalid)
+    return result
+
+def deg2pix(deg, true=False, masked=False):
+    """Convert from degrees of visual space to pixels. deg can be a scalar or an array, Nones
+    are treated as 0. If true, use the trigonometric projection onto the screen instead of the
+    arc length, see deg2truepix. If masked, return a masked array, masked wherever deg is None"""
     # shouldn't I be using opp = 2.0 * distance * tan(deg/2), ie trig instead of solid angle
-    # of a circle ???!!
+    # of a circle ???!! Yes, set true=True
+    if true:
+        return deg2truepix(deg, masked=masked)
+    if iterable(deg) or masked:
+        deg, isnone = floatarray(deg)
+        return convresult(I.SCREENDISTANCECM * (deg * math.pi / 180) * I.PIXPERCM, isnone, masked)
     if deg == None:
         deg = 0 # convert to an int
     rad = deg * math.pi / 180 # float, angle in radians
     s = I.SCREENDISTANCECM * rad # arc length in cm
     return s * I.PIXPERCM # float, arc length in pixels
 
-def deg2truepix(deg):
-    return 2.0 * I.SCREENDISTANCECM * I.PIXPERCM * math.tan(deg*math.pi/90)
-
-def pix2deg(pix):
-    """Convert from pixels to degrees of visual space"""
-    # shouldn't we be using arctan?????!!!!!!!
+def deg2truepix(deg, masked=False):
+    """Convert from degrees of visual space to pixels, using the projection onto the flat screen
+    of an angle centered on the line of sight: 2 * distance * tan(deg/2). deg can be a scalar or
+    an array, Nones are treated as 0. If masked, return a masked array, masked wherever deg is None"""
+    if iterable(deg) or masked:
+        deg, isnone = floatarray(deg)
+        return convresult(2.0 * I.SCREENDISTANCECM * I.PIXPERCM * np.tan(deg * math.pi / 360), isnone, masked)
+    if deg == None:
+        deg = 0
+    return 2.0 * I.SCREENDISTANCECM * I.PIXPERCM * math.tan(deg * math.pi / 360)
+
+def pix2deg(pix, true=False, masked=False):
+    """Convert from pixels to degrees of visual space. pix can be a scalar or an array, Nones
+    are treated as 0. If true, invert the trigonometric projection instead of the arc length,
+    see truepix2deg. If masked, return a masked array, masked wherever pix is None"""
+    # shouldn't we be using arctan?????!!!!!!! Yes, set true=True
+    if true:
+        return truepix2deg(pix, masked=masked)
+    if iterable(pix) or masked:
+        pix, isnone = floatarray(pix)
+        return convresult(pix / I.PIXPERCM / I.SCREENDISTANCECM * 180 / math.pi, isnone, masked)
     if pix == None:
         pix = 0 # convert to an int
     s = pix / I.PIXPERCM # arc length in cm
     rad = s / I.SCREENDISTANCECM # angle in radians
     return rad * 180 / math.pi # float, angle in degrees
+
+def truepix2deg(pix, masked=False):
+    """Convert from pixels to degrees of visual space, the inverse of deg2truepix.
+    pix can be a scalar or an array, Nones are treated as 0. If masked, return a masked array,
+    masked wherever pix is None"""
+    if iterable(pix) or masked:
+        pix, isnone = floatarray(pix)
+        return convresult(np.arctan(pix / (2.0 * I.SCREENDISTANCECM * I.PIXPERCM)) * 360 / math.pi, isnone, masked)
+    if pix == None:
+        pix = 0
+    return math.atan(pix / (2.0 * I.SCREENDISTANCECM * I.PIXPERCM)) * 360 / math.pi
 '''
 def quantizeSpace(npix, ncells):
     """Dec or inc (whichever's closer) npix to make multiple of ncells"""
@@ -681,8 +1132,15 @@ def msec2vsync(msec):
     """Convert from msec to number of vsyncs"""
     return sec2vsync(msec / 1000) # float
 
-def sec2intvsync(sec):
-    """Convert from sec to an integer number of vsyncs"""
+def sec2intvsync(sec, masked=False):
+    """Convert from sec to an integer number of vsyncs. sec can be a scalar or an array, Nones
+    are treated as 0. If masked, return a masked array, masked wherever sec is None"""
+    if iterable(sec) or masked:
+        sec, isnone = floatarray(sec)
+        vsync = sec2vsync(sec)
+        vsync = np.sign(vsync) * np.floor(np.abs(vsync) + 0.5) # round half away from 0, same as round()
+        vsync[(vsync == 0) & (sec != 0)] = 1 # at least 1 vsync for any non-zero interval
+        return convresult(vsync.astype(int), isnone, masked)
     vsync = intround(sec2vsync(sec))
     # prevent rounding down to 0 vsyncs. This way, even the shortest time interval in sec
     # will get you at least 1 vsync
@@ -707,8 +1165,16 @@ def vsync2msec(vsync):
     """Convert from number of vsyncs to msec"""
     return vsync2sec(vsync) * 1000.0 # float
 
-def degSec2pixVsync(degSec):
-    """Convert speed from degress of visual space per sec to pixels per vsync"""
+def degSec2pixVsync(degSec, masked=False):
+    """Convert speed from degress of visual space per sec to pixels per vsync. degSec can be a
+    scalar or an array. Zero and None speeds give 0.0. If masked, return a masked array,
+    masked wherever degSec is zero or None"""
+    if iterable(degSec) or masked:
+        degSec, invalid = floatarray(degSec)
+        invalid |= degSec == 0
+        safe = np.where(invalid, 1, degSec) # avoid dividing by zero
+        pixVsync = np.where(invalid, 0.0, 1 / sec2vsync(1 / deg2pix(safe)))
+        return convresult(pixVsync, invalid, masked)
     try:
         pixSec = deg2pix(degSec)
         secPix = 1 / pixSec
@@ -717,8 +1183,16 @@ def degSec2pixVsync(degSec):
     except (ZeroDivisionError, FloatingPointError):
         return 0.0 # float
 
-def cycSec2cycVsync(cycSec):
-    """Convert temporal frequency from cycles per sec to cycles per vsync"""
+def cycSec2cycVsync(cycSec, masked=False):
+    """Convert temporal frequency from cycles per sec to cycles per vsync. cycSec can be a
+    scalar or an array. Zero and None frequencies give 0.0. If masked, return a masked array,
+    masked wherever cycSec is zero or None"""
+    if iterable(cycSec) or masked:
+        cycSec, invalid = floatarray(cycSec)
+        invalid |= cycSec == 0
+        safe = np.where(invalid, 1, cycSec) # avoid dividing by zero
+        cycVsync = np.where(invalid, 0.0, 1 / sec2vsync(1 / safe))
+        return convresult(cycVsync, invalid, masked)
     try:
         secCyc = 1 / cycSec
         vsyncCyc = sec2vsync(secCyc) # float
@@ -726,8 +1200,16 @@ def cycSec2cycVsync(cycSec):
     except (ZeroDivisionError, FloatingPointError):
         return 0.0 # float
 
-def cycDeg2cycPix(cycDeg):
-    """Convert spatial frequency from cycles per degree of visual space to cycles per pixel"""
+def cycDeg2cycPix(cycDeg, masked=False):
+    """Convert spatial frequency from cycles per degree of visual space to cycles per pixel.
+    cycDeg can be a scalar or an array. Zero and None frequencies give 0.0. If masked, return
+    a masked array, masked wherever cycDeg is zero or None"""
+    if iterable(cycDeg) or masked:
+        cycDeg, invalid = floatarray(cycDeg)
+        invalid |= cycDeg == 0
+        safe = np.where(invalid, 1, cycDeg) # avoid dividing by zero
+        cycPix = np.where(invalid, 0.0, 1 / deg2pix(1 / safe))
+        return convresult(cycPix, invalid, masked)
     try:
         degCyc = 1 / cycDeg
         pixCyc = deg2pix(degCyc) # float
@@ -735,6 +1217,52 @@ def cycDeg2cycPix(cycDeg):
     except (ZeroDivisionError, FloatingPointError):
         return 0.0 # float
 
+def constarray(val, n):
+    """Return a read-only array of length n, every entry of which is val. Unless val is
+    an object (like None), all entries share the memory of a single value (zero stride)"""
+    a = np.asarray([val])
+    if a.dtype == object: # strided views of object arrays aren't supported by all numpy versions
+        result = np.empty(n, dtype=object)
+        result.fill(val)
+    else:
+        result = as_strided(a, shape=(n,), strides=(0,))
+    result.flags.writeable = False
+    return result
+
+def hashint(x, key):
+    """Return pseudorandom uint64 hashes of non-negative ints x, for the given key (the splitmix64
+    finalizer). x and key can be scalars or arrays. Always returns an array"""
+    z = np.atleast_1d(np.asarray(x, dtype=np.uint64)) # arrays wrap on overflow, scalars would raise
+    z = z + np.atleast_1d(np.asarray(key, dtype=np.uint64)) * np.uint64(0x9e3779b97f4a7c15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
+
+def permute(x, n, key, nrounds=4):
+    """Return where ints x in range(n) end up in a pseudorandom permutation of range(n) selected by
+    key (a scalar, or an array the same length as x), without generating the whole permutation.
+    Uses a balanced Feistel network over the smallest even number of bits that covers n,
+    cycle walking any results that fall outside of range(n) back in"""
+    nbits = 2
+    while 2**nbits < n:
+        nbits += 2
+    half = np.uint64(nbits // 2)
+    mask = np.uint64(2**(nbits // 2) - 1)
+    x = np.atleast_1d(np.asarray(x, dtype=np.uint64))
+    key = np.atleast_1d(np.asarray(key, dtype=np.uint64)) + np.zeros(len(x), dtype=np.uint64)
+    roundkeys = [ hashint(roundi, key) for roundi in range(nrounds) ]
+    def feistel(x, roundkeys):
+        left, right = x >> half, x & mask
+        for roundkey in roundkeys:
+            left, right = right, left ^ (hashint(right, roundkey) & mask)
+        return (left << half) | right
+    x = feistel(x, roundkeys)
+    outside = x >= np.uint64(n)
+    while outside.any(): # cycle walk
+        x[outside] = feistel(x[outside], [ roundkey[outside] for roundkey in roundkeys ])
+        outside = x >= np.uint64(n)
+    return x.astype(np.int64)
+
 def isotime(sec, ndec=6):
     """Convert from sec to ISO HH:MM:SS[.mmmmmm] format, rounds to ndec number of decimal
     digits"""
@@ -803,9 +1331,12 @@ def shuffle(seq):
     every time you use it"""
     return random.sample(seq, len(seq))
 '''
-def shuffle(seq):
+def shuffle(seq, rng=None):
     """Take a sequence and return a shuffled (without replacement) copy. Its only benefit over
-    np.random.shuffle is that it returns a copy instead of shuffling in-place"""
+    np.random.shuffle is that it returns a copy instead of shuffling in-place. Draws from RNG rng,
+    or from numpy's global random state if rng is None"""
+    if rng != None:
+        return rng.shuffle(seq)
     result = copy(seq)
     np.random.shuffle(result) # shuffles in-place, doesn't convert to an array
     return result
@@ -818,9 +1349,12 @@ def randomize(seq):
         result.append(random.choice(seq))
     return result
 '''
-def randomize(seq):
+def randomize(seq, rng=None):
     """Return a randomized (with replacement) output sequence sampled from
-    (and of the same length as) the input sequence"""
+    (and of the same length as) the input sequence. Draws from RNG rng,
+    or from numpy's global random state if rng is None"""
+    if rng != None:
+        return rng.randomize(seq)
     n = len(seq)
     i = np.random.randint(n, size=n) # returns random ints from 0 to len(seq)-1
     if seq.__class__ == np.ndarray:
@@ -47,6 +47,8 @@ PyObject * DT_initBoard(PyObject *self);
 PyObject * DT_closeBoard(PyObject *self);
 PyObject * DT_postInt16Wait(PyObject *self, PyObject *args);
 PyObject * DT_postInt16(PyObject *self, PyObject *args);
+PyObject * DT_postInt20Wait(PyObject *self, PyObject *args);
+PyObject * DT_postInt20(PyObject *self, PyObject *args);
 PyObject * DT_postInt32Wait(PyObject *self, PyObject *args);
 PyObject * DT_postInt32(PyObject *self, PyObject *args);
 PyObject * DT_postInt32_2x16(PyObject *self, PyObject *args);
@@ -193,6 +195,9 @@ static PyMethodDef DT_methods[] = {
     {"postInt16Wait", (PyCFunction) DT_postInt16Wait, METH_VARARGS,
         "Post an int16 to port, followed by a snooze to ensure acquistion sees it"},
     {"postInt16", (PyCFunction) DT_postInt16, METH_VARARGS, "Post an int16 to port"},
+    {"postInt20Wait", (PyCFunction) DT_postInt20Wait, METH_VARARGS,
+        "Post a 20 bit int to port, followed by a snooze to ensure acquistion sees it"},
+    {"postInt20", (PyCFunction) DT_postInt20, METH_VARARGS, "Post a 20 bit int to port"},
     {"postInt32Wait", (PyCFunction) DT_postInt32Wait, METH_VARARGS,
         "Post an int32 to port, followed by a snooze to ensure acquistion sees it"},
     {"postInt32", (PyCFunction) DT_postInt32, METH_VARARGS, "Post an int32 to port"},
@@ -278,6 +283,8 @@ PyObject * DT_initBoard(PyObject * self)
     [60, 26, 59, 25, 58, 24, 57, 23, 55, 21, 54, 20, 53, 19, 52].
     Pin 56 is a convenient digital ground.
     Port C line 0, used as the RECORD bit to trigger acquisition to start saving, is pin 51.
+    When posting 20 bit ints, Port C lines 0 to 3 carry the 4 high data bits instead,
+    and the RECORD bit moves up to Port C line 4.
     See DT340 manual "UM340.pdf" */
     if (olDaSetResolution(hDout, 32) != OLNOERROR)
     {
@@ -364,6 +371,46 @@ PyObject * DT_postInt16(PyObject *self, PyObject *args)
     return Py_None;
 }
 
+// Post a 20 bit int to port, followed by a snooze to ensure acquistion sees it.
+// The 4 high bits go out on Port C lines 0 to 3, see DT_initBoard()
+PyObject * DT_postInt20Wait(PyObject *self, PyObject *args)
+{
+    PyObject *arglist;
+    long val;
+    if (!PyArg_ParseTuple (args, "i", &val))
+    {
+        puts("Error occured parsing arguments in postInt20Wait");
+        arglist = Py_BuildValue("i", -1);
+        Py_INCREF(arglist);
+        return arglist;
+    }
+    incChecksum(val);
+    post(val & 0x000fffff);
+    snooze();
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+// Post a 20 bit int to port
+PyObject * DT_postInt20(PyObject *self, PyObject *args)
+{
+    PyObject *arglist;
+    long val;
+    if (!PyArg_ParseTuple (args, "i", &val))
+    {
+        puts("Error occured parsing arguments in postInt20");
+        arglist = Py_BuildValue("i", -1);
+        Py_INCREF(arglist);
+        return arglist;
+    }
+    incChecksum(val);
+    post(val & 0x000fffff);
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 // Post an int32 to port, followed by a snooze to ensure acquistion sees it
 PyObject * DT_postInt32Wait(PyObject *self, PyObject *args)
 {
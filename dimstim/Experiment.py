@@ -3,12 +3,12 @@
 from __future__ import division
 
 import os
+import re
 import time
 import datetime
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
 import OpenGL.GL as gl
-import pygame
 
 import VisionEgg as ve
 import VisionEgg.Core # isn't imported automatically by VE's __init__.py
@@ -17,6 +17,8 @@ from VisionEgg.MoreStimuli import Target2D
 import Constants as C
 from Constants import I, dc
 import Core
+import Telemetry
+from Input import Input
 from Core import iterable, toiter, deg2pix, sec2intvsync, vsync2sec, isotime
 try:
     from Core import DT # only importable if DT board is installed
@@ -31,6 +33,16 @@ printf2log = printer.printf2log
 
 class Experiment(object):
     """Base Experiment class, all experiments inherit from this"""
+    dryrun = False # if set, build() only checks things, and doesn't log or save anything to disk
+    deferheader = False # if set, build() leaves building the text header to a later buildheader() call
+    longsession = False # if set, the VsyncTimer keeps its memory use flat, for Experiments that run for hours
+    startii = 0 # position in the sweep sequence to start from, see Resume.py
+    resumeof = None # text header file name of the interrupted Experiment this one resumes
+    session = None # Session this Experiment is being run in, if any, see Session.py
+    checkpointfname = None # file name progress is saved to, set once the text header is saved
+    checkpointsec = 10 # save progress at most this often (sec)
+    lastcheckpoint = 0 # time.clock() time progress was last saved
+
     def __init__(self, script, static, dynamic, variables, runs=None, blanksweeps=None):
         self.script = script.replace('\\', C.SLASH).replace('.pyc', '.py') # Experiment script file name, with stuff cleaned up
         self.script = os.path.splitdrive(self.script)[-1] # strip the drive name from the start
@@ -48,28 +60,53 @@ class Experiment(object):
         for paramname, paramval in self.dynamic.items():
             if paramname not in self.variables.keys():
                 assert not iterable(paramval), 'dynamic parameter %s is a vector, yet it isn\'t entered as a Variable' % paramname
+        assert self.static.dinbits in (16, 20), 'dinbits must be 16 or 20, not %r' % self.static.dinbits
+
+    def setdinbits(self):
+        """Set the value posted to indicate a blank sweep, the RECORD bit, and the function
+        that posts values to the port, according to the number of digital lines in use"""
+        if self.static.dinbits == 20:
+            self.blankpostval, self.recordbit = C.MAXPOSTABLEINT20, C.RECORD20
+        else:
+            self.blankpostval, self.recordbit = C.MAXPOSTABLEINT, C.RECORD
+        if I.DTBOARDINSTALLED:
+            self.postInt = {16: DT.postInt16, 20: DT.postInt20}[self.static.dinbits]
+
+    def initrng(self):
+        """Init this Experiment's random number generator. Store the seed actually used,
+        so that it ends up in the text header"""
+        self.rng = Core.RNG(self.static.seed)
+        self.static.seed = self.rng.seed
 
     def calcduration(self):
         """Calculates how long this Experiment should take, in sec"""
-        i = self.sweeptable.i
         # convert all times to vsyncs, add 'em up, then convert back. This takes into account discretization from sec to vsync
-        try:
-            blanksweepvsyncs = sec2intvsync(self.blanksweeps.sec) * list(i).count(None)
-        except AttributeError: # blanksweeps are None, None has no .sec attrib
-            blanksweepvsyncs = 0
-        # sweep table indices that aren't blank sweeps, i was an object array due to Nones in it:
-        notblank = np.int32(i[np.not_equal(i, None)])
-        nvsyncs = sec2intvsync(self.static.preexpSec) + \
-                  np.asarray([ sec2intvsync(sweeptime) for sweeptime in self.st.sweepSec[notblank] ]).sum() + \
-                  np.asarray([ sec2intvsync(postsweeptime) for postsweeptime in self.st.postsweepSec[notblank] ]).sum() + \
-                  blanksweepvsyncs + \
-                  sec2intvsync(self.static.postexpSec)
+        nvsyncs = sec2intvsync(self.static.preexpSec) + sec2intvsync(self.static.postexpSec)
+        nblanksweeps = 0
+        start = 0 # position of each chunk in the sweep sequence
+        for i in self.sweeptable.iterchunks(): # blank sweeps are -1
+            start += len(i)
+            i = i[max(self.startii - (start - len(i)), 0):] # leave out sweeps displayed before a resume
+            notblank = i[i != -1] # sweep table indices that aren't blank sweeps
+            nblanksweeps += len(i) - len(notblank)
+            # convert whole columns at once:
+            nvsyncs += sec2intvsync(self.st.sweepSec[notblank]).sum() + \
+                       sec2intvsync(self.st.postsweepSec[notblank]).sum()
+        if nblanksweeps:
+            nvsyncs += sec2intvsync(self.blanksweeps.sec) * nblanksweeps
         return vsync2sec(nvsyncs)
 
     def build(self):
         """Builds the SweepTable and the Header for this Experiment"""
-        # Build the sweep table
-        self.sweeptable = Core.SweepTable(experiment=self)
+        self.setdinbits()
+
+        self.initrng()
+
+        # Build the sweep table. With 20 digital lines, it's computed on demand to fit in constant memory
+        if self.static.dinbits == 20:
+            self.sweeptable = Core.StreamingSweepTable(experiment=self)
+        else:
+            self.sweeptable = Core.SweepTable(experiment=self)
         self.st = self.sweeptable.data # synonym, used a lot by Experiment subclasses
 
         # Do time and space conversions of applicable static and dynamic parameters.
@@ -82,8 +119,16 @@ class Experiment(object):
         self.sec = self.calcduration()
         info('Expected experiment duration: %s' % isotime(self.sec, 6), tolog=False)
 
+        if not self.deferheader:
+            self.buildheader()
+
+    def buildheader(self):
+        """Builds the text header, prints it to log, and saves it to a separate file.
+        The header is timestamped, so this should happen shortly before the Experiment is displayed"""
         # Build the text header and print it to log
         self.header = Core.Header(experiment=self)
+        if self.dryrun:
+            return # don't log or save the text header, we're only validating
         info('TextHeader.data:', toscreen=False)
         printf2log(str(self.header.text)) # print text header data to log
 
@@ -99,6 +144,33 @@ class Experiment(object):
         f.write(str(self.header.text))
         f.close()
 
+        # Save the sweep table alongside it in binary form, for fast loading during analysis
+        self.sweeptable.save(os.path.splitext(fname)[0] + '.sweeptable.npz')
+
+        self.txthdrfname = fname
+        self.checkpointfname = os.path.splitext(fname)[0] + '.checkpoint'
+
+    def checkpoint(self, ii, force=False):
+        """Save progress to self.checkpointfname: the first ii sweeps in the sweep sequence have
+        been displayed. Together with the text header (which holds the seed), this is enough to
+        resume the Experiment from sweep ii, see Resume.py. Unless forced, progress is saved
+        at most every self.checkpointsec"""
+        if not self.checkpointfname:
+            return
+        now = time.clock()
+        if not force and now - self.lastcheckpoint < self.checkpointsec:
+            return
+        self.lastcheckpoint = now
+        checkpoint = {'textheader': self.txthdrfname,
+                      'experiment': type(self).__name__,
+                      'seed': self.static.seed,
+                      'ii': ii, # number of sweeps displayed
+                      'nsweeps': len(self.sweeptable.i),
+                      'datetime': str(datetime.datetime.now())}
+        f = open(self.checkpointfname, 'w')
+        f.write(repr(checkpoint))
+        f.close()
+
     def setgamma(self, gamma):
         """Set VisionEgg's gamma parameter"""
         vc = VisionEgg.config
@@ -141,7 +213,7 @@ class Experiment(object):
             onstates.append(stim.parameters.on)
 
         # update the stimulus before first sweep, prevents first-sweep lag for movies > 1GB
-        self.updateparams(self.sweeptable.i[0])
+        self.updateparams(self.sweeptable.i[min(self.startii, len(self.sweeptable.i)-1)])
 
         # Draw all stimuli to the viewport once in advance, fixes another kind of lag on first sweep
         for stim in self.stimuli:
@@ -163,28 +235,48 @@ class Experiment(object):
             ve.Core.swap_buffers() # returns immediately
             gl.glFlush() # if this is the first buffer swap, returns immediately, otherwise waits for next vsync pulse from video card
 
-    def staticscreen(self, nvsyncs, postval=C.MAXPOSTABLEINT):
+    def staticscreen(self, nvsyncs, postval=None):
         """Display whatever's defined in the viewport on-screen for nvsyncs,
-        and posts postval to the port. Adds ticks to self.vsynctimer"""
+        and posts postval to the port (self.blankpostval by default). Adds ticks to self.vsynctimer.
+        Nothing changes on screen for the duration, so the scene is only drawn on the first
+        2 vsyncs, once into each buffer. After that, the buffers are just swapped, unless
+        I.REDRAWSTATIC is set"""
+        if postval == None:
+            postval = self.blankpostval
         #assert nvsyncs >= 1 # nah, let it take nvsyncs=0 and do nothing and return right away
-        vsynci = 0
+        vsynci = self.skip(0, nvsyncs)
         while vsynci < nvsyncs: # originally needed to use a while loop for pause to work
-            for event in pygame.event.get(): # for all events in the event queue
-                if event.type == pygame.locals.KEYDOWN:
-                    if event.key == pygame.locals.K_ESCAPE:
-                        self.quit = True
+            if self.input.poll(): # ESC has been hit
+                self.quit = True
             if self.quit:
                 break # out of vsync loop
             # post value to port:
             if I.DTBOARDINSTALLED:
-                DT.postInt16(postval) # post value to port
+                self.postInt(postval) # post value to port
                 self.nvsyncsdisplayed += 1 # increment. Count this as a vsync that acq has seen
-            self.screen.clear()
-            self.viewport.draw()
+            if vsynci < 2 or I.REDRAWSTATIC: # both buffers aren't yet up to date
+                self.screen.clear()
+                self.viewport.draw()
             ve.Core.swap_buffers() # returns immediately
             gl.glFlush() # waits for next vsync pulse from video card
             self.vsynctimer.tick()
-            vsynci += 1
+            vsynci = self.skip(vsynci + 1, nvsyncs)
+
+    def skip(self, vsynci, nvsyncs):
+        """Return the index of the next of nvsyncs vsyncs to display, given that vsynci is next
+        in line. In time-locked mode, this skips over as many vsyncs as have been missed by drops,
+        so that whatever's indexed by vsynci stays locked to the clock. Skipping can't go past
+        nvsyncs. Whatever's left is skipped next time, in the following sweep if need be.
+        Sweeps never skip their first vsync, so every sweep in the sweep sequence is displayed,
+        and its sweep table index posted to acq, for at least one vsync. A run of late
+        1-vsync sweeps, like an m-sequence, can't catch up by skipping, and is left late"""
+        if not self.static.timelocked or not self.vsynctimer.nmissed:
+            return vsynci
+        n = min(self.vsynctimer.nmissed, nvsyncs - vsynci)
+        if n > 0:
+            self.vsynctimer.skip(n)
+            vsynci += n
+        return vsynci
 
     def get_framebuffer(self, i):
         """Get the raw frame buffer data that corresponds to what's
@@ -214,27 +306,46 @@ class Experiment(object):
         # Init OpenGL graphics screen
         self.screen = ve.Core.get_default_screen()
 
+        # Create the stimuli and display the experiment on self.screen
+        self.display()
+
+        # Close OpenGL graphics screen (necessary when running from Python interpreter)
+        self.screen.close()
+
+        self.report()
+
+    def display(self):
+        """Create the stimuli, and display the already built experiment on self.screen"""
         # Create VisionEgg stimuli objects, defined by each specific subclass of Experiment
         self.createstimuli()
 
-        # Create a VisionEgg Viewport
-        self.viewport = ve.Core.Viewport(screen=self.screen, stimuli=self.stimuli)
+        # Create a VisionEgg Viewport, or reuse the Session's, just swapping in this Experiment's stimuli
+        if self.session:
+            self.viewport = self.session.viewport
+            self.viewport.parameters.stimuli = self.stimuli
+        else:
+            self.viewport = ve.Core.Viewport(screen=self.screen, stimuli=self.stimuli)
 
         self.initbackgroundcolor()
 
         self.fix1stsweeplag() # 1st sweep lag hacks
 
         # Create the VsyncTimer
-        self.vsynctimer = Core.VsyncTimer()
+        self.vsynctimer = Core.VsyncTimer(longsession=self.longsession)
+        if I.TELEMETRY: # stream live timing stats
+            self.vsynctimer.telemetry = Telemetry.Publisher(I.TELEMETRY, experiment=self)
 
         # Init DT board
         if I.DTBOARDINSTALLED:
             DT.initBoard()
             DT.setChecksum(0) # reset DT module's checksum variable
             DT.postInt32(0) # clear the value on the port
-            DT.postInt32Wait(C.RECORD) # trigger acquisition with +ve edge of RECORD bit
+            DT.postInt32Wait(self.recordbit) # trigger acquisition with +ve edge of RECORD bit
 
+        self.input = Input() # keep event polling out of the way of the vsync loops
         self.quit = False # init quit signal
+        if self.session and self.session.quit: # quit was posted to the Session before display started
+            self.quit = True # Session.post() sets Session.quit first, so checking after the reset can't miss it
         self.nvsyncsdisplayed = 0 # nvsyncs seen by acq
 
         # time-critical stuff starts here
@@ -243,12 +354,14 @@ class Experiment(object):
 
         self.startdatetime = datetime.datetime.now()
         self.starttime = time.clock() # precision timestamp
+        self.checkpoint(self.startii, force=True)
 
         # Do pre-experiment delay
         self.staticscreen(nvsyncs=sec2intvsync(self.static.preexpSec))
 
         # Run the main stimulus loop, defined by each specific subclass of Experiment
         self.main()
+        self.checkpoint(self.ii, force=True)
 
         # Do post-experiment delay
         self.staticscreen(nvsyncs=sec2intvsync(self.static.postexpSec))
@@ -257,6 +370,10 @@ class Experiment(object):
         self.stopdatetime = datetime.datetime.now()
         # time-critical stuff ends here
 
+        self.input.close()
+        if self.vsynctimer.telemetry:
+            self.vsynctimer.telemetry.close()
+
         # clear the port, print the Experiment checksum, close the board:
         if I.DTBOARDINSTALLED:
             DT.postInt32(0) # clear the value on the port
@@ -265,15 +382,55 @@ class Experiment(object):
             DT.setChecksum(0) # reset DT module's checksum variable
             DT.closeBoard()
 
-        # Close OpenGL graphics screen (necessary when running from Python interpreter)
-        self.screen.close()
-
-        # Print messages to VisionEgg log and to screen
+    def status(self):
+        """Return a dict of progress so far, for the control server, see Control.py"""
+        status = {'experiment': type(self).__name__,
+                  'script': self.script,
+                  'ii': getattr(self, 'sweepii', None), # current position in the sweep sequence
+                  'nsweeps': len(self.sweeptable.i),
+                  'nvsyncsdisplayed': getattr(self, 'nvsyncsdisplayed', 0),
+                  'vsynctimer': None}
+        if hasattr(self, 'vsynctimer'):
+            status['vsynctimer'] = self.vsynctimer.stats()
+        return status
+
+    def report(self):
+        """Print end of experiment messages to VisionEgg log and to screen"""
         info(self.vsynctimer.pprint())
         info('%d vsyncs displayed, %d sweeps completed' % (self.nvsyncsdisplayed, self.ii))
+        if self.startii:
+            info('resumed from sweep %d of %s' % (self.startii, self.resumeof))
         info('Experiment duration: %s expected, %s actual' % (isotime(self.sec, 6), isotime(self.stoptime-self.starttime, 6)))
         if self.quit:
             warning('dimstim was interrupted before completion')
         else:
             info('dimstim completed successfully')
         printf2log('\n' + '-'*80 + '\n') # add minuses to end of log to space it out between sessions
+
+RUNLINE = re.compile(r'^(\s*)(#?)\s*([\w.]+)\.run\(') # indent, comment, name of the Experiment it runs
+
+def loadscript(fname):
+    """Execute Experiment script fname without running it, and return a list of the Experiment
+    objects it runs, in the order it runs them. Lines that run an Experiment are replaced with
+    a statement that records it instead. Run lines the TextHeader has commented out count too,
+    so text headers can be loaded as well. A script that runs nothing returns all the
+    Experiments it defines, in no particular order"""
+    f = open(fname, 'r')
+    lines = []
+    for line in f:
+        if '.run(' in line:
+            stripped = line.lstrip()
+            indent = line[:len(line)-len(stripped)]
+            match = RUNLINE.match(line)
+            if match and (not match.group(2) or 'commented out by dimstim' in line):
+                line = '%s__dimstimruns__.append(%s) # %s # replaced by dimstim\n' % (indent, match.group(3), stripped.rstrip())
+            else:
+                line = '%spass # %s # commented out by dimstim\n' % (indent, stripped.rstrip())
+        lines.append(line)
+    f.close()
+    namespace = {'__file__': fname, '__name__': '__dimstimscript__', '__dimstimruns__': []}
+    exec compile(''.join(lines), fname, 'exec') in namespace
+    runs = [ val for val in namespace['__dimstimruns__'] if isinstance(val, Experiment) ]
+    if runs:
+        return runs
+    return [ val for val in namespace.values() if isinstance(val, Experiment) ]
@@ -0,0 +1,170 @@
+"""Procedural movie frame sources, for Movie experiments that would otherwise have to load
+hundreds of MB of m-sequence or white noise frames from disk. Frames can be indexed just like a
+list of loaded frames. While frames are being played in order, blocks of consecutive frames are
+generated ahead of time in a background thread, so indexing costs next to nothing. Frames that
+are asked for out of order are generated one at a time, on the spot.
+Every frame depends only on the source's params and its own frame index, so frames can be
+displayed in any order, and regenerated exactly during analysis"""
+
+from __future__ import division
+
+import threading
+import Queue
+
+import numpy as np
+
+from Core import hashint, permute
+
+MSEQTAPS = (16, 15, 13, 4) # x**16 + x**15 + x**13 + x**4 + 1 is primitive, gives 2**16 - 1 frames
+
+
+def mseq(taps=MSEQTAPS):
+    """Return the m-sequence generated by a linear feedback shift register with the given taps,
+    as an array of 2**max(taps) - 1 bits. Each bit is the XOR of the bits taps back. The bits
+    are generated min(taps) at a time, which is as many as are known in advance"""
+    nbits = max(taps)
+    n = 2**nbits - 1
+    step = min(taps)
+    seq = np.zeros(n + step, dtype=np.uint8) # room for overshoot
+    seq[nbits-1] = 1 # any nonzero initial state will do
+    for i in xrange(nbits, n, step):
+        bits = seq[i-taps[0]:i-taps[0]+step].copy()
+        for tap in taps[1:]:
+            bits ^= seq[i-tap:i-tap+step]
+        seq[i:i+step] = bits
+    return seq[:n]
+
+
+class Frames(object):
+    """Base class for procedural frame sources. Frames are uint8 arrays of shape
+    (ncellshigh, ncellswide), generated by subclasses' generate(). Whenever a frame follows
+    the one asked for before it, the block of blocksize frames it's in and the block after
+    that are generated ahead of time in a background thread, so that when the vsync loop gets
+    to them, they're ready. Only those two blocks are kept around. Any frame that isn't ready
+    is generated on its own, on the spot"""
+    def __init__(self, ncellswide=64, ncellshigh=64, nframes=2**16-1, blocksize=64):
+        self.ncellswide = ncellswide
+        self.ncellshigh = ncellshigh
+        self.ncells = ncellswide * ncellshigh
+        self.nframes = nframes
+        self.blocksize = blocksize
+        self.blocks = {} # blocks generated ahead of time, indexed by block index
+        self.requested = set() # indices of blocks waiting to be generated
+        self.lastframei = None # frame asked for last
+        self.requests = Queue.Queue()
+        self.thread = None # started on the first request
+
+    def __len__(self):
+        return self.nframes
+
+    def __getitem__(self, framei):
+        if not 0 <= framei < self.nframes:
+            raise IndexError, 'frame index %d out of range' % framei
+        blocki = framei // self.blocksize
+        if framei in (self.lastframei, (self.lastframei or 0) + 1): # playing in order, look ahead
+            for i in [blocki, blocki+1]:
+                self.request(i)
+            for i in self.blocks.keys(): # list copy, the thread may add to it
+                if i not in (blocki, blocki+1):
+                    del self.blocks[i]
+        self.lastframei = framei
+        block = self.blocks.get(blocki)
+        if block is not None: # can't use != on an array
+            return block[framei % self.blocksize]
+        return self.generate(np.array([framei])).reshape(self.ncellshigh, self.ncellswide)
+
+    def request(self, blocki):
+        """Have block blocki generated in the background, unless it's already been"""
+        if blocki*self.blocksize >= self.nframes or blocki in self.blocks or blocki in self.requested:
+            return
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.setDaemon(True) # don't hang on exit if never closed
+            self.thread.start()
+        self.requested.add(blocki)
+        self.requests.put(blocki)
+
+    def run(self):
+        """Generate requested blocks until told to stop. Runs in the background"""
+        while True:
+            blocki = self.requests.get()
+            if blocki == None:
+                break
+            start = blocki * self.blocksize
+            frameis = np.arange(start, min(start + self.blocksize, self.nframes))
+            self.blocks[blocki] = self.generate(frameis).reshape(-1, self.ncellshigh, self.ncellswide)
+            self.requested.discard(blocki) # only once it's in self.blocks, so it's never requested twice
+
+    def close(self):
+        """Stop the background thread"""
+        if self.thread != None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def generate(self, frameis):
+        """Return the cell values of frames frameis, as a uint8 array of shape
+        (len(frameis), ncells)"""
+        raise NotImplementedError
+
+
+class MSeqFrames(Frames):
+    """m-sequence frames. Each cell plays the same m-sequence of black and white, with each cell
+    shifted shift steps further along the sequence than the one before it, in row order.
+    shift defaults to spreading the cells evenly over the whole sequence"""
+    def __init__(self, ncellswide=64, ncellshigh=64, taps=MSEQTAPS, shift=None, blocksize=64):
+        self.seq = mseq(taps) * np.uint8(255) # black and white
+        super(MSeqFrames, self).__init__(ncellswide=ncellswide, ncellshigh=ncellshigh,
+                                         nframes=len(self.seq), blocksize=blocksize)
+        if shift == None:
+            shift = self.nframes // self.ncells
+        self.shift = shift
+        self.offsets = np.arange(self.ncells) * shift # sequence offset of each cell
+
+    def generate(self, frameis):
+        return self.seq[(frameis[:, np.newaxis] + self.offsets) % self.nframes]
+
+
+class NoiseFrames(Frames):
+    """Binary (black and white) or ternary (black, grey and white) white noise frames, each cell
+    drawn at random, but repeatably, given the seed and the frame index"""
+    def __init__(self, ncellswide=64, ncellshigh=64, nframes=2**16-1, nlevels=2, seed=0, blocksize=64):
+        super(NoiseFrames, self).__init__(ncellswide=ncellswide, ncellshigh=ncellshigh,
+                                          nframes=nframes, blocksize=blocksize)
+        assert nlevels in (2, 3), 'white noise must be binary or ternary'
+        self.nlevels = nlevels
+        self.levels = np.uint8(np.round(np.linspace(0, 255, nlevels))) # cell values
+        self.seed = seed
+
+    def generate(self, frameis):
+        cellis = frameis[:, np.newaxis].astype(np.uint64) * np.uint64(self.ncells) + np.arange(self.ncells, dtype=np.uint64)
+        h = hashint(cellis.ravel(), self.seed).reshape(cellis.shape)
+        return self.levels[(h >> np.uint64(32)) % np.uint64(self.nlevels)]
+
+
+class SparseFrames(Frames):
+    """Multi-cell sparse noise frames. In each frame, nlit cells are lit black or white, and the
+    rest are mid grey. Which cells are lit, and at which polarity, is drawn at random, but
+    repeatably, given the seed and the frame index"""
+    def __init__(self, ncellswide=64, ncellshigh=64, nframes=2**16-1, nlit=1, seed=0, blocksize=64):
+        super(SparseFrames, self).__init__(ncellswide=ncellswide, ncellshigh=ncellshigh,
+                                           nframes=nframes, blocksize=blocksize)
+        assert 1 <= nlit <= self.ncells, 'can light 1 to %d cells per frame, not %d' % (self.ncells, nlit)
+        self.nlit = nlit
+        self.levels = np.uint8(np.round(np.linspace(0, 255, 3))) # black, grey, white
+        self.seed = seed
+
+    def generate(self, frameis):
+        nframes = len(frameis)
+        # the lit cells are where the first nlit cells end up in a permutation of all the cells,
+        # one permutation per frame, so only nlit cells per frame need any work
+        keys = np.repeat(hashint(frameis, self.seed), self.nlit)
+        lit = permute(np.tile(np.arange(self.nlit), nframes), self.ncells, keys).reshape(nframes, self.nlit)
+        cellis = frameis[:, np.newaxis].astype(np.uint64) * np.uint64(self.ncells) + lit.astype(np.uint64)
+        h = hashint(cellis.ravel(), self.seed).reshape(cellis.shape)
+        polarity = (h >> np.uint64(32)) % np.uint64(2) # 0 is black, 1 is white
+        rows = np.arange(nframes)[:, np.newaxis]
+        frames = np.empty((nframes, self.ncells), dtype=np.uint8)
+        frames.fill(self.levels[1])
+        frames[rows, lit] = self.levels[2*polarity]
+        return frames
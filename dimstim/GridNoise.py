@@ -0,0 +1,143 @@
+"""Defines the GridNoise Experiment"""
+
+from __future__ import division
+
+import numpy as np
+np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
+import OpenGL.GL as gl
+
+import VisionEgg as ve
+import VisionEgg.Core
+from VisionEgg.Textures import TextureStimulus, Texture
+
+import Constants as C
+from Constants import I
+import Core
+from Core import sec2intvsync, deg2pix, toiter
+try:
+    from Core import DT # only importable if DT board is installed
+except ImportError:
+    pass
+from Experiment import Experiment
+from Frames import MSeqFrames, NoiseFrames, SparseFrames, MSEQTAPS
+
+
+class GridNoise(Experiment):
+    """Grid noise experiment. Dense or multi-cell sparse noise on the same grid of cells as
+    SparseNoise. Instead of drawing each cell as a Target2D, the whole grid is drawn as a single
+    texture with one texel per cell, so the cost of drawing a frame doesn't depend on how many
+    cells are lit. Frames are generated on demand, see Frames.py. Row yi of a frame is the
+    row of cells yi from the bottom of the grid, as in SparseNoise"""
+    def check(self):
+        """Check GridNoise-specific parameters"""
+        super(GridNoise, self).check()
+        assert self.static.noise in ('sparse', 'binary', 'ternary', 'mseq'), 'unknown noise type %r' % self.static.noise
+
+    def build(self):
+        """Builds the SweepTable and the Header for this Experiment, and the frame source"""
+        super(GridNoise, self).build()
+        s = self.static # synonym
+        if s.noise == 'sparse':
+            self.frames = SparseFrames(ncellswide=s.ncellswide, ncellshigh=s.ncellshigh,
+                                       nframes=s.get('nframes', 2**16-1), nlit=s.get('nlit', 1),
+                                       seed=self.rng.seed)
+        elif s.noise == 'mseq':
+            self.frames = MSeqFrames(ncellswide=s.ncellswide, ncellshigh=s.ncellshigh,
+                                     taps=s.get('mseqtaps', MSEQTAPS), shift=s.get('mseqshift'))
+        else: # 'binary' or 'ternary'
+            self.frames = NoiseFrames(ncellswide=s.ncellswide, ncellshigh=s.ncellshigh,
+                                      nframes=s.get('nframes', 2**16-1),
+                                      nlevels={'binary': 2, 'ternary': 3}[s.noise],
+                                      seed=self.rng.seed)
+        self.nframes = len(self.frames)
+        assert max(toiter(self.dynamic.framei)) <= self.nframes-1, 'Frame indices exceed noise size of %d frames' % self.nframes
+
+    def createstimuli(self):
+        """Creates the VisionEgg stimuli objects for this Experiment subclass"""
+        super(GridNoise, self).createstimuli()
+        shape = self.static.ncellshigh, self.static.ncellswide
+        self.grid = TextureStimulus(texture=Texture(np.zeros(shape, dtype=np.uint8)), # frames get uploaded as needed
+                                    position=(self.xorig, self.yorig), # init to orig
+                                    anchor='center',
+                                    # texture is scaled to this size, one texel per cell:
+                                    size=(deg2pix(self.static.widthDeg), deg2pix(self.static.heightDeg)),
+                                    max_alpha=1.0,
+                                    mipmaps_enabled=False,
+                                    texture_min_filter=gl.GL_NEAREST, # sharp cell edges
+                                    texture_mag_filter=gl.GL_NEAREST,
+                                    on=False) # leave it off for now
+
+        # last entry will be topmost layer in viewport:
+        self.stimuli = (self.background, self.grid)
+
+        self.gp = self.grid.parameters # synonym
+        self.to = self.gp.texture.get_texture_object()
+        self.buf = np.zeros(shape, dtype=np.uint8) # for inverted frames
+        self.frameid = None # (frame index, invert) of the frame last uploaded to the texture
+
+    def updateparams(self, i):
+        """Updates stimulus parameters, given sweep table index i"""
+        if i == None: # do a blank sweep
+            self.gp.on = False # turn off the grid, leave all other parameters unchanged
+            self.postval = self.blankpostval # posted to DT port to indicate a blank sweep
+            self.nvsyncs = sec2intvsync(self.blanksweeps.sec) # this many vsyncs for this sweep
+            self.npostvsyncs = 0 # this many post-sweep vsyncs for this sweep, blank sweeps have no post-sweep delay
+        else: # not a blank sweep
+            self.gp.on = True # ensure grid is on
+            self.postval = i # sweep table index will be posted to DT port
+            self.nvsyncs = sec2intvsync(self.st.sweepSec[i]) # this many vsyncs for this sweep
+            self.npostvsyncs = sec2intvsync(self.st.postsweepSec[i]) # this many post-sweep vsyncs for this sweep
+
+            # Update all cells at once, unless the texture already holds this sweep's frame
+            frameid = self.st.framei[i], self.st.invert[i]
+            if frameid != self.frameid:
+                frame = self.frames[self.st.framei[i]]
+                if self.st.invert[i]:
+                    frame = np.subtract(255, frame, self.buf) # give the frame inverted polarity
+                self.to.put_sub_image(frame, data_format=gl.GL_LUMINANCE, data_type=gl.GL_UNSIGNED_BYTE)
+                self.frameid = frameid
+
+            # Rotate and position the grid as a whole, no per cell trig
+            self.gp.angle = self.static.orioff + self.st.ori[i]
+            self.gp.position = self.xorig+deg2pix(self.st.xposDeg[i]), self.yorig+deg2pix(self.st.yposDeg[i])
+
+            # Update background parameters
+            self.bgp.color = self.st.bgbrightness[i], self.st.bgbrightness[i], self.st.bgbrightness[i], 1.0
+
+    def main(self):
+        """Run the main stimulus loop for this Experiment subclass"""
+        for ii, i in enumerate(self.sweeptable.i):
+
+            if ii < self.startii:
+                continue # already displayed before being interrupted, see Resume.py
+            self.sweepii = ii # current position in the sweep sequence
+            self.updateparams(i)
+
+            # Set sweep bit high, do the sweep
+            vsynci = 0 # always display and post the first vsync, even of a late sweep, see skip()
+            while vsynci < self.nvsyncs: # nvsyncs depends on if this is a blank sweep or not
+                if self.input.poll(): # ESC has been hit
+                    self.quit = True
+                if self.quit:
+                    break # out of vsync loop
+                if I.DTBOARDINSTALLED: self.postInt(self.postval) # post value to port
+                self.screen.clear()
+                self.viewport.draw()
+                ve.Core.swap_buffers() # returns immediately
+                gl.glFlush() # waits for next vsync pulse from video card
+                self.vsynctimer.tick()
+                self.nvsyncsdisplayed += 1 # increment
+                vsynci = self.skip(vsynci + 1, self.nvsyncs)
+
+            # Sweep's done, turn off the grid, do the postsweep delay, clear sweep bit low
+            self.gp.on = False
+            self.staticscreen(nvsyncs=self.npostvsyncs) # clears sweep bit low when done
+
+            if self.quit:
+                self.ii = ii + 1 - 1 # dec for accurate count of nsweeps successfully displayed
+                break # out of sweep loop
+
+            self.checkpoint(ii + 1) # save progress every so often
+
+        self.ii = ii + 1 # nsweeps successfully displayed
+        self.frames.close() # stop generating frames ahead of time
@@ -0,0 +1,45 @@
+"""Defines the Input class, for keeping keyboard input out of the way of the vsync loops"""
+
+from __future__ import division
+
+import pygame
+
+from Core import sec2intvsync
+
+POLLSEC = 0.02 # poll the event queue this often (sec), fast enough to not notice any lag
+
+
+class Input(object):
+    """Gathers pygame keyboard input on behalf of an Experiment's vsync loops. Mouse and other
+    events are blocked from even entering the event queue, and the queue is only polled every
+    pollsec, so the cost of polling doesn't depend on how many events the OS delivers. State is
+    published in plain attributes (self.quit, self.keys), so checking it costs next to nothing.
+    SDL only lets the thread that opened the screen pump its events, so this is done from within
+    the vsync loops instead of from a thread of its own"""
+    def __init__(self, pollsec=POLLSEC):
+        self.pollvsyncs = max(sec2intvsync(pollsec), 1) # poll every this many calls to poll()
+        self.vsynci = 0 # calls to poll() since the queue was last polled
+        self.quit = False # has ESC been hit?
+        self.keys = [] # keys hit as of the last time the queue was polled
+        pygame.event.set_blocked(None) # block all events...
+        pygame.event.set_allowed([pygame.locals.KEYDOWN, pygame.locals.QUIT]) # ...except these
+
+    def poll(self):
+        """Call once per vsync. Poll the event queue if it's time to, and return self.quit"""
+        self.vsynci += 1
+        if self.vsynci < self.pollvsyncs:
+            return self.quit
+        self.vsynci = 0
+        self.keys = []
+        for event in pygame.event.get(): # for all events in the event queue
+            if event.type == pygame.locals.KEYDOWN:
+                self.keys.append(event.key)
+                if event.key == pygame.locals.K_ESCAPE:
+                    self.quit = True
+            elif event.type == pygame.locals.QUIT: # window closed
+                self.quit = True
+        return self.quit
+
+    def close(self):
+        """Let all events back into the event queue"""
+        pygame.event.set_allowed(None)
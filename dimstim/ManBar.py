@@ -6,6 +6,7 @@ import os
 import math
 import time
 import datetime
+from collections import deque
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
 import pyglet.window
@@ -26,9 +27,13 @@ import Core
 from Core import sec2intvsync, deg2pix, pix2deg, iterable, isotime, intround, roundec
 from Window import Window
 from Experiment import Experiment, info, printf2log
+from Input import POLLSEC
+from Recorder import Recorder
+import Control
 
 STATUSBARHEIGHT = 12 # height of upper and lower status bars (pix)
 FLASHRATEMULT = 1 + 0.75 / I.REFRESHRATE
+TEXTSEC = 0.2 # update status bar text at most this often (sec), it's re-rendered on every update
 
 def invramp(gamma):
     """Inverted gamma ramp"""
@@ -39,6 +44,14 @@ def invramp(gamma):
 
 class ManBar(Experiment):
     """Manual bar experiment"""
+    fullrate = False # default for scripts that don't set it, see examples/manbar.py
+    record = False # ditto
+    recorder = None
+    control = None
+    # params that can be set by the control server while running, see Control.py. xDeg and yDeg
+    # are the position from screen center:
+    liveparams = ['xDeg', 'yDeg', 'ori', 'widthDeg', 'heightDeg', 'brightness', 'bgbrightness',
+                  'flash', 'flashSec']
     def __init__(self, script, params):
         self.script = script.replace('\\', C.SLASH).replace('.pyc', '.py') # Experiment script file name, with stuff cleaned up
         self.script = os.path.splitdrive(self.script)[-1] # strip the drive name from the start
@@ -55,6 +68,11 @@ class ManBar(Experiment):
         self.PLUS, self.MINUS = False, False
         self.LEFTBUTTON, self.RIGHTBUTTON, self.SCROLL = False, False, False
         self.eyei = C.EYESTATES.index(eye)
+        # Init dirty tracking, only push params to stimuli when they change, see updatestimuli()
+        self.stimstate = None # state last pushed to the stimuli
+        self.textstate = None # state last shown in the status bar text
+        self.lasttextvsync = None # vsync the status bar text was last updated on
+        self.mailbox = deque() # requests left by the control server for main() to apply
 
     def build(self):
         """Builds the SweepTable and the Header, not required for ManBar experiment"""
@@ -202,7 +220,7 @@ class ManBar(Experiment):
             self.flashSec *= FLASHRATEMULT
         elif self.PAGEDOWN:
             self.flashSec /= FLASHRATEMULT
-        self.flashvsyncs = sec2intvsync(self.flashSec)
+        self.flashvsyncs = intround(sec2intvsync(self.flashSec) / self.nflipscreens) # normalize by number of screens to flip in each loop in main()
         self.flashvsyncs = max(self.flashvsyncs, 1) # keep it >= 1, % 0 gives ZeroDivisionError
 
     def get_brightness(self):
@@ -221,25 +239,49 @@ class ManBar(Experiment):
         dc.update()
         self.brightenText = 'Eye' # brighten the text for feedback
 
+    def textdue(self, state):
+        """Return whether the status bar text needs updating, given the state it shows. Setting
+        Text re-renders its texture, so only do so when state has changed, and at most every
+        TEXTSEC. A change that comes too soon gets shown on a following vsync"""
+        if state == self.textstate:
+            return False
+        if self.textstate != None and self.nvsyncsdisplayed - self.lasttextvsync < self.textvsyncs:
+            return False
+        self.textstate = state
+        self.lasttextvsync = self.nvsyncsdisplayed
+        return True
+
+    def settext(self, textparams, text):
+        """Set Text parameters textparams to text, if it differs from what's already there"""
+        if textparams.text != text:
+            textparams.text = text
+
     def updatestimuli(self):
-        """Update stimuli"""
+        """Update stimuli. Only push params that have changed since the last vsync"""
         # Update target params
-        width = deg2pix(self.widthDeg) # convenience
-        height = deg2pix(self.heightDeg)
-        self.tp.position = self.x, self.y
-        self.tp.size = width, height # convert to pix
-        self.tp.orientation = self.ori
-        self.tp.color = (self.brightness, self.brightness, self.brightness, 1.0)
-        self.bgp.color = (self.bgbrightness, self.bgbrightness, self.bgbrightness, 1.0)
-        self.tipp.position = ( self.x + width / 2 * math.cos(math.pi / 180 * self.ori),
-                               self.y + width / 2 * math.sin(math.pi / 180 * self.ori) )
-        self.tipp.orientation = self.ori
-        self.cp.position = self.x, self.y # update center spot position
+        state = (self.x, self.y, self.widthDeg, self.heightDeg, self.ori, self.brightness, self.bgbrightness)
+        if state != self.stimstate:
+            self.stimstate = state
+            width = deg2pix(self.widthDeg) # convenience
+            height = deg2pix(self.heightDeg)
+            self.tp.position = self.x, self.y
+            self.tp.size = width, height # convert to pix
+            self.tp.orientation = self.ori
+            self.tp.color = (self.brightness, self.brightness, self.brightness, 1.0)
+            self.bgp.color = (self.bgbrightness, self.bgbrightness, self.bgbrightness, 1.0)
+            self.tipp.position = ( self.x + width / 2 * math.cos(math.pi / 180 * self.ori),
+                                   self.y + width / 2 * math.sin(math.pi / 180 * self.ori) )
+            self.tipp.orientation = self.ori
+            self.cp.position = self.x, self.y # update center spot position
+
         # Update text params
-        self.mbtp.text = 'x, y = (%5.1f, %5.1f) deg  |  size = (%.1f, %.1f) deg  |  ori = %5.1f deg' \
-                         % ( pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
-                             self.widthDeg, self.heightDeg, self.ori)
-        self.stp.text = 'Eye open: %s  |  ' % C.EYESTATES[self.eyei] + self.screenstring
+        if not self.textdue((self.x, self.y, self.widthDeg, self.heightDeg, self.ori,
+                             self.eyei, self.brightenText, self.squarelock)):
+            return
+        self.settext(self.mbtp, 'x, y = (%5.1f, %5.1f) deg  |  size = (%.1f, %.1f) deg  |  ori = %5.1f deg'
+                                % ( pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
+                                    self.widthDeg, self.heightDeg, self.ori))
+        self.settext(self.stp, 'Eye open: %s  |  ' % C.EYESTATES[self.eyei] + self.screenstring)
 
         if self.brightenText == 'Manbar0':
             self.mbtp.color = (1.0, 1.0, 0.0, 1.0) # set to yellow
@@ -256,6 +298,59 @@ class ManBar(Experiment):
         else:
             self.sltp.on = False
 
+    def status(self):
+        """Return a dict of the current state, for the control server, see Control.py"""
+        status = {'experiment': type(self).__name__,
+                  'script': self.script,
+                  'nvsyncsdisplayed': self.nvsyncsdisplayed,
+                  'vsynctimer': self.vsynctimer.stats(),
+                  'xDeg': pix2deg(self.x - I.SCREENWIDTH / 2),
+                  'yDeg': pix2deg(self.y - I.SCREENHEIGHT / 2)}
+        for name in self.liveparams:
+            if name not in status:
+                status[name] = getattr(self, name)
+        return status
+
+    def post(self, request):
+        """Leave a request from the control server for main() to apply between vsyncs. Called
+        from the control server's thread"""
+        if request['cmd'] == 'set':
+            for name in request['params']:
+                if name not in self.liveparams:
+                    raise ValueError, "can't set %r, only %r" % (name, self.liveparams)
+        self.mailbox.append(request) # deque appends are atomic, no need for a lock
+
+    def applyrequests(self):
+        """Apply requests left by the control server"""
+        while self.mailbox:
+            request = self.mailbox.popleft()
+            if request['cmd'] == 'quit':
+                for win in self.wins:
+                    win.win.has_exit = True
+            elif request['cmd'] == 'set':
+                for name, val in request['params'].items():
+                    if name == 'xDeg':
+                        self.x = intround(deg2pix(val) + I.SCREENWIDTH / 2)
+                    elif name == 'yDeg':
+                        self.y = intround(deg2pix(val) + I.SCREENHEIGHT / 2)
+                    else:
+                        setattr(self, name, val)
+
+    def recordstate(self):
+        """Record the current state of the bar to the trajectory file"""
+        self.recorder.add(self.nvsyncsdisplayed,
+                          pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
+                          self.ori, self.widthDeg, self.heightDeg, self.brightness,
+                          self.bgbrightness, self.tp.on)
+
+    def startrecording(self):
+        """Start recording the stimulus trajectory every vsync, to a timestamped .traj file"""
+        scriptfname = os.path.basename(self.script) # drop its path
+        scriptfname, ext = os.path.splitext(scriptfname) # drop its .py extension
+        dtstr = datetime.datetime.now().strftime('%y%m%d_%H%M%S') # same format as .rhd timestamp
+        fname = os.path.join(dc.get('Path', 'txthdr'), scriptfname + '_' + dtstr + '.traj')
+        self.recorder = Recorder(fname)
+
     def run(self, caption='Manual bar'):
         """Run the experiment"""
         info('Running Experiment script: %s' % self.script)
@@ -266,7 +361,13 @@ class ManBar(Experiment):
         self.screens = display.get_screens()
         self.screens = self.screens[:self.nscreens] # keep the first nscreens requested
         self.nscreens = len(self.screens) # update
-        self.flashvsyncs = intround(self.flashvsyncs / self.nscreens) # normalize by number of screens to flip in each loop in main()
+        # number of screens whose buffer flips wait for a vsync in each loop in main(). In full
+        # rate mode, only the last screen's do, so all of them are updated every vsync:
+        if self.fullrate:
+            self.nflipscreens = 1
+        else:
+            self.nflipscreens = self.nscreens
+        self.flashvsyncs = intround(self.flashvsyncs / self.nflipscreens) # normalize by number of screens to flip in each loop in main()
         self.wins = []
         for screeni, screen in enumerate(self.screens):
             # make all screens fullscreen, except for the first (user) screen
@@ -278,6 +379,8 @@ class ManBar(Experiment):
             else:
                 win = Window(screen=screen, fullscreen=True)
             win.win.set_exclusive_mouse(True)
+            if self.fullrate and screeni < len(self.screens) - 1:
+                win.win.set_vsync(False) # flip right away, let the last screen wait for the vsync
             self.wins.append(win)
 
         self.setgamma(self.params.gamma)
@@ -305,15 +408,29 @@ class ManBar(Experiment):
         pygame.mouse.set_pos(self.x, I.SCREENHEIGHT - 1 - self.y) # set that sucker
         '''
         self.attach_handlers()
+        self.pollvsyncs = max(intround(sec2intvsync(POLLSEC) / self.nflipscreens), 1) # secondary window event polling period
+        self.textvsyncs = max(intround(sec2intvsync(TEXTSEC) / self.nflipscreens), 1) # status bar text update period
 
         self.nvsyncsdisplayed = 0 # nvsyncs seen by acq
 
+        if self.record:
+            self.startrecording()
+        if I.CONTROL:
+            self.control = Control.Server(I.CONTROL, self)
+            self.control.start()
+
         self.startdatetime = datetime.datetime.now()
         self.starttime = time.clock() # precision timestamp
 
         # Run the main stimulus loop, defined by each specific subclass of Experiment
         self.main()
 
+        if self.control:
+            self.control.close()
+        if self.recorder:
+            self.recorder.close()
+            info('%d vsyncs of stimulus trajectory saved to %s' % (self.recorder.n, self.recorder.fname))
+
         self.stoptime = time.clock() # precision timestamp
         self.stopdatetime = datetime.datetime.now()
 
@@ -424,12 +541,21 @@ class ManBar(Experiment):
             win.win.push_handlers(self.on_mouse_release)
             win.win.push_handlers(self.on_mouse_scroll)
 
+    def dispatch_events(self):
+        """Dispatch window events to the event handlers. The user's window gets its events
+        dispatched every vsync. The others don't need to be as responsive, so leave their event
+        polling out of most vsyncs, to keep it out of the way of drawing"""
+        self.wins[0].dispatch_events()
+        if not self.nvsyncsdisplayed % self.pollvsyncs:
+            for win in self.wins[1:]:
+                win.dispatch_events()
+
     def main(self):
         """Run the main stimulus loop"""
         while np.alltrue([ not win.win.has_exit for win in self.wins ]):
 
-            for win in self.wins:
-                win.dispatch_events() # to the event handlers
+            self.dispatch_events()
+            if self.mailbox: self.applyrequests()
 
             self.get_size()
             self.get_ori()
@@ -442,6 +568,8 @@ class ManBar(Experiment):
                     self.tp.on = not self.tp.on # toggle it
                     self.tipp.on = not self.tipp.on
 
+            if self.recorder: self.recordstate()
+
             for win, viewport in zip(self.wins, self.viewports):
                 win.switch_to()
                 win.clear()
@@ -28,6 +28,8 @@ from ManBar import STATUSBARHEIGHT, ManBar
 
 class ManGrating(ManBar):
     """Manual grating experiment"""
+    liveparams = ['xDeg', 'yDeg', 'ori', 'tfreqCycSec', 'sfreqCycDeg', 'contrast', 'bgbrightness',
+                  'flash', 'flashSec']
 
     def createstimuli(self):
         """Creates the VisionEgg stimuli objects for this Experiment"""
@@ -131,35 +133,42 @@ class ManGrating(ManBar):
         #self.contrast = min(self.contrast, 1) # keep it <= 1
 
     def updatestimuli(self):
-        """Update stimuli"""
+        """Update stimuli. Only push params that have changed since the last vsync, except for
+        phase, which changes every vsync"""
         # Update grating params
-        height = deg2pix(self.heightDeg) # convenience
-        self.gp.position = self.x, self.y
-        self.gp.orientation = self.ori
+        state = (self.x, self.y, self.ori, self.tfreqCycSec, self.sfreqCycDeg, self.contrast, self.bgbrightness)
+        if state != self.stimstate:
+            self.stimstate = state
+            self.gp.position = self.x, self.y
+            self.gp.orientation = self.ori
+            self.sfreq = cycDeg2cycPix(self.sfreqCycDeg)
+            self.phasestep = cycSec2cycVsync(self.tfreqCycSec * self.nflipscreens) * 360 # delta cycles per vsync, in degrees of sinusoid, adjust for buffer flips on multiple screens
+            self.gp.spatial_freq = self.sfreq
+            self.gp.contrast = self.contrast
+            self.bgp.color = (self.bgbrightness, self.bgbrightness, self.bgbrightness, 1.0)
+            self.cp.position = self.x, self.y # update center spot position
 
         """Generate phase given current params
         sine grating eq'n used by VE: luminance(x) = 0.5*contrast*sin(2*pi*sfreqCycDeg*x + phaseRad) + ml ...where x is the position in deg along the axis of the sinusoid, and phaseRad = phaseDeg/180*pi. Motion in time is achieved by changing phaseDeg over time. phaseDeg inits to phase0"""
-        sfreq = cycDeg2cycPix(self.sfreqCycDeg)
         try:
             self.phase
         except AttributeError: # phase hasn't been init'd yet
+            height = deg2pix(self.heightDeg) # convenience
             """phaseoffset is req'd to make phase0 the initial phase at the centre of the grating, instead of at the edge of the grating as VE does. Take the distance from the centre to the edge along the axis of the sinusoid (which in this case is the height), multiply by spatial freq to get numcycles between centre and edge, multiply by 360 deg per cycle to get req'd phaseoffset. THE EXTRA 180 DEG IS NECESSARY FOR SOME REASON, DON'T REALLY UNDERSTAND WHY, BUT IT WORKS!!!"""
-            phaseoffset = height / 2 * sfreq * 360 + 180
+            phaseoffset = height / 2 * self.sfreq * 360 + 180
             self.phase = -self.phase0 - phaseoffset
 
-        phasestep = cycSec2cycVsync(self.tfreqCycSec * self.nscreens) * 360 # delta cycles per vsync, in degrees of sinusoid, adjust for buffer flips on multiple screens
-        self.phase = self.phase - phasestep # update phase
-
-        self.gp.spatial_freq = sfreq
+        self.phase = self.phase - self.phasestep # update phase
         self.gp.phase_at_t0 = self.phase
-        self.gp.contrast = self.contrast
-        self.bgp.color = (self.bgbrightness, self.bgbrightness, self.bgbrightness, 1.0)
-        self.cp.position = self.x, self.y # update center spot position
+
         # Update text params
-        self.mgtp.text = 'x, y = (%5.1f, %5.1f) deg  |  ori = %5.1f deg  |  tfreq = %.2f cyc/sec  |  sfreq = %.2f cyc/deg  |  contrast = %.2f' \
-                         % ( pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
-                             self.ori, self.tfreqCycSec, self.sfreqCycDeg, self.contrast)
-        self.stp.text = 'Eye open: %s  |  ' % C.EYESTATES[self.eyei] + self.screenstring
+        if not self.textdue((self.x, self.y, self.ori, self.tfreqCycSec, self.sfreqCycDeg,
+                             self.contrast, self.eyei, self.brightenText)):
+            return
+        self.settext(self.mgtp, 'x, y = (%5.1f, %5.1f) deg  |  ori = %5.1f deg  |  tfreq = %.2f cyc/sec  |  sfreq = %.2f cyc/deg  |  contrast = %.2f'
+                                % ( pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
+                                    self.ori, self.tfreqCycSec, self.sfreqCycDeg, self.contrast))
+        self.settext(self.stp, 'Eye open: %s  |  ' % C.EYESTATES[self.eyei] + self.screenstring)
 
         if self.brightenText == 'Manbar0':
             self.mgtp.color = (1.0, 1.0, 0.0, 1.0) # set to yellow
@@ -171,6 +180,13 @@ class ManGrating(ManBar):
             self.mgtp.color = (0.0, 1.0, 0.0, 1.0) # set it back to green
             self.stp.color = (0.0, 1.0, 1.0, 1.0) # set it back to cyan
 
+    def recordstate(self):
+        """Record the current state of the grating to the trajectory file"""
+        self.recorder.add(self.nvsyncsdisplayed,
+                          pix2deg(self.x - I.SCREENWIDTH / 2), pix2deg(self.y - I.SCREENHEIGHT / 2),
+                          self.ori, self.widthDeg, self.heightDeg, self.ml, self.bgbrightness,
+                          self.gp.on, self.tfreqCycSec, self.sfreqCycDeg, self.contrast)
+
     def run(self):
         """Run the experiment"""
         super(ManGrating, self).run(caption='Manual grating')
@@ -240,8 +256,8 @@ class ManGrating(ManBar):
         """Run the main stimulus loop"""
         while np.alltrue([ not win.win.has_exit for win in self.wins ]):
 
-            for win in self.wins:
-                win.dispatch_events() # to the event handlers
+            self.dispatch_events()
+            if self.mailbox: self.applyrequests()
 
             self.get_ori()
             self.get_tfreq()
@@ -253,6 +269,8 @@ class ManGrating(ManBar):
                 if not self.nvsyncsdisplayed % self.flashvsyncs:
                     self.gp.on = not self.gp.on # toggle it
 
+            if self.recorder: self.recordstate()
+
             for win, viewport in zip(self.wins, self.viewports):
                 win.switch_to()
                 win.clear()
@@ -2,10 +2,10 @@
 
 from __future__ import division
 
+import os
 import struct
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
-import pygame
 import time
 import OpenGL.GL as gl
 from pprint import pprint
@@ -17,49 +17,212 @@ from VisionEgg.Textures import TextureStimulus, Mask2D, Texture
 import Constants as C
 from Constants import I
 import Core
-from Core import sec2intvsync, vsync2sec, degSec2pixVsync, deg2pix, toiter
+from Core import sec2intvsync, vsync2sec, degSec2pixVsync, deg2pix, toiter, dictattr
 try:
     from Core import DT # only importable if DT board is installed
 except ImportError:
     pass
-from Experiment import Experiment
+from Experiment import Experiment, info
+from Frames import Frames, MSeqFrames, NoiseFrames, MSEQTAPS
+
+# texture upload format for each number of channels per cell
+GLFORMATS = {1: gl.GL_LUMINANCE, 3: gl.GL_RGB, 4: gl.GL_RGBA}
+
+
+def readheader(f):
+    """Read the header, if any, at the start of open movie file f. Return the movie's width and
+    height in cells, its number of frames, its number of channels per cell, and the offset of
+    its first frame in the file. A 'movie' header is for greyscale movies, a 'movic' header is
+    for colour movies, and has an extra field for the number of channels, 3 for RGB or 4 for RGBA"""
+    headerstring = f.read(5)
+    if headerstring in ['movie', 'movic']: # a header has been added to the start of the file
+        ncellswide, = struct.unpack('H', f.read(2)) # 'H'== unsigned short int
+        ncellshigh, = struct.unpack('H', f.read(2))
+        nframes, = struct.unpack('H', f.read(2))
+        if nframes == 0: # this was used in Cat 15 mseq movies to indicate 2**16 frames, shouldn't really worry about this, cuz we're using slightly modified mseq movies now that don't have the extra frame at the end that the Cat 15 movies had (see comment in Experiment module), and therefore never have a need to indicate 2**16 frames
+            nframes = 2**16
+        if headerstring == 'movic':
+            nchannels, = struct.unpack('H', f.read(2))
+            if nchannels not in GLFORMATS:
+                raise ValueError, 'Movie file has %d channels per cell, can only play %r' % (nchannels, GLFORMATS.keys())
+        else:
+            nchannels = 1
+        offset = f.tell() # header is 11 bytes long, 13 for colour
+    else: # there's no header at the start of the file, set the file pointer back to the beginning and use these hard coded values:
+        f.seek(0)
+        ncellswide = ncellshigh = 64
+        nframes = 6000
+        nchannels = 1
+        offset = f.tell() # header is 0 bytes long
+    return ncellswide, ncellshigh, nframes, nchannels, offset
+
+def frameshape(ncellswide, ncellshigh, nchannels):
+    """Return the array shape of a movie frame"""
+    if nchannels == 1:
+        return (ncellshigh, ncellswide)
+    return (ncellshigh, ncellswide, nchannels)
+
+def checksize(fname, offset, nframes, framesize):
+    """Check that the size of movie file fname matches its header"""
+    nbytes = os.path.getsize(fname)
+    if nbytes != offset + nframes*framesize:
+        raise RuntimeError, 'Movie file %r is %d bytes long, expected %d. Width, height, or nframes is incorrect in the movie file header.' % (fname, nbytes, offset + nframes*framesize)
+
+def permovie(val, moviei):
+    """Return the value of static param val for movie moviei in the playlist. val is either a
+    tuple of values, one per movie, or a single value shared by all of them"""
+    if type(val) == tuple:
+        return val[moviei]
+    return val
+
+def makelut(nchannels, gamma=None, contrast=1, invert=False):
+    """Return 8 to 8 bit lookup tables for each of nchannels channels, concatenated into one
+    flat uint8 array, with channel c's table starting at c*256. gamma and contrast are either
+    single values, or tuples with one value per channel. Contrast is scaled about mid grey,
+    then polarity is inverted if invert, then the inverse of gamma is applied"""
+    luts = []
+    for c in range(nchannels):
+        ramp = np.arange(256) / 255 # normalized linear ramp
+        if contrast != None:
+            ramp = 0.5 + toiter(contrast)[c % len(toiter(contrast))] * (ramp - 0.5)
+            ramp = ramp.clip(0, 1)
+        if invert:
+            ramp = 1 - ramp
+        if gamma:
+            ramp = np.power(ramp, 1 / toiter(gamma)[c % len(toiter(gamma))]) # inverted gamma ramp
+        luts.append(np.uint8(np.round(ramp * 255))) # convert back to nearest ints
+    return np.concatenate(luts)
 
 
 class Movie(Experiment):
-    """Movie experiment"""
+    """Movie experiment. static.fname can be a tuple of movie file names, a playlist, in
+    which case dynamic.moviei indexes into it. Movies in a playlist are memory-mapped, and
+    can differ in size. static.widthDeg and static.heightDeg can be tuples too, one entry per
+    movie. Movies of the same size in cells and on screen share a texture and mask, so
+    switching movies between sweeps never allocates anything.
+
+    Movies can be greyscale, RGB or RGBA. static.lutgamma and static.lutcontrast, either single
+    values or one per channel, are applied to each frame through per-channel lookup tables, as
+    is inversion. Don't combine lutgamma with VisionEgg's static.gamma, or gamma will be
+    corrected for twice"""
     def __init__(self, *args, **kwargs):
         super(Movie, self).__init__(*args, **kwargs)
-        self.static.fname = self.static.fname.replace('\\', C.SLASH) # replace double backslashes with single forward slash
+        if 'noise' not in self.static.keys(): # most Movie scripts play a movie file
+            self.static.noise = None
+        self.playlist = type(self.static.get('fname')) == tuple
+        if self.playlist:
+            self.static.fname = tuple([ fname.replace('\\', C.SLASH) for fname in self.static.fname ])
+        elif not self.static.noise:
+            self.static.fname = self.static.fname.replace('\\', C.SLASH) # replace double backslashes with single forward slash
         if 'fixationspotDeg' not in self.dynamic.keys(): # most Movie scripts won't bother specifying it
             self.dynamic.fixationspotDeg = False # default to off
+        if self.playlist and 'moviei' not in self.dynamic.keys(): # only playlists need it
+            self.dynamic.moviei = 0 # default to the first movie
 
     def check(self):
         """Check Movie-specific parameters"""
         super(Movie, self).check()
+        assert self.static.noise in (None, 'mseq', 'binary', 'ternary'), 'unknown noise type %r' % self.static.noise
+        if self.playlist:
+            assert not self.static.noise, 'noise movies can\'t be played in a playlist'
+            nmovies = len(self.static.fname)
+            assert max(toiter(self.dynamic.moviei)) <= nmovies-1, 'Movie indices exceed playlist size of %d movies' % nmovies
+            for paramname in ['widthDeg', 'heightDeg']:
+                val = self.static[paramname]
+                assert type(val) != tuple or len(val) == nmovies, 'static.%s must have one entry per movie in the playlist' % paramname
+        elif 'moviei' in self.dynamic.keys():
+            assert toiter(self.dynamic.moviei) == [0], 'dynamic.moviei is only for playlists, static.fname is a single movie'
+        for paramname in ['lutgamma', 'lutcontrast']:
+            assert len(toiter(self.static.get(paramname))) in (1, 3, 4), 'static.%s must be a single value, or one per channel' % paramname
 
     def build(self):
         """Builds the SweepTable and the Header for this Experiment, and loads movie frames"""
         super(Movie, self).build()
-        self.load()
+        if self.playlist:
+            self.openplaylist() # nothing to load
+            return
+        if self.static.noise:
+            self.initnoise() # nothing to load
+        elif self.dryrun:
+            self.checkfile() # much faster than loading all the frames
+        else:
+            self.load(frameis=sorted(set(toiter(self.dynamic.framei)))) # only those that get displayed
         assert max(toiter(self.dynamic.framei)) <= self.nframes-1, 'Frame indices exceed movie size of %d frames' % self.nframes
-
-    def load(self, asarray=False, flip=True):
-        """Load movie frames"""
+        self.movies = [dictattr(fname=self.static.get('fname'), frames=getattr(self, 'frames', None),
+                                ncellswide=self.ncellswide, ncellshigh=self.ncellshigh,
+                                nframes=self.nframes, nchannels=self.nchannels)]
+
+    def openplaylist(self):
+        """Memory-map all the movies in the playlist. Each file is opened once, and frames are
+        only read from disk as they're displayed"""
+        self.f = None # each movie file is closed once it's memory-mapped
+        self.movies = []
+        for fname in self.static.fname:
+            f = file(fname, 'rb')
+            ncellswide, ncellshigh, nframes, nchannels, offset = readheader(f)
+            f.close()
+            checksize(fname, offset, nframes, ncellshigh*ncellswide*nchannels)
+            frames = np.memmap(fname, dtype=np.uint8, mode='r', offset=offset,
+                               shape=(nframes,)+frameshape(ncellswide, ncellshigh, nchannels))
+            frames = frames[::, ::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
+            self.movies.append(dictattr(fname=fname, frames=frames, ncellswide=ncellswide,
+                                        ncellshigh=ncellshigh, nframes=nframes, nchannels=nchannels))
+        if max(toiter(self.dynamic.framei)) <= min([ movie.nframes for movie in self.movies ]) - 1:
+            return # frame indices are within every movie
+        for i in xrange(self.sweeptable.nconditions): # check frame indices against each movie's length
+            movie = self.movies[self.getmoviei(i)]
+            if self.st.framei[i] > movie.nframes-1:
+                raise ValueError, 'Frame index %d exceeds size of movie %r of %d frames' % (self.st.framei[i], movie.fname, movie.nframes)
+
+    def getmoviei(self, i):
+        """Return the index into self.movies of the movie to play for sweep table index i.
+        Only playlists have a moviei column in the sweep table, anything else plays movie 0"""
+        if self.playlist:
+            return self.st.moviei[i]
+        return 0
+
+    def initnoise(self):
+        """Generate m-sequence or white noise frames on demand, instead of loading them from a
+        movie file, see Frames.py. White noise is seeded with the Experiment's seed"""
+        s = self.static # synonym
+        ncellswide, ncellshigh = s.get('ncellswide', 64), s.get('ncellshigh', 64)
+        if s.noise == 'mseq':
+            self.frames = MSeqFrames(ncellswide=ncellswide, ncellshigh=ncellshigh,
+                                     taps=s.get('mseqtaps', MSEQTAPS), shift=s.get('mseqshift'))
+        else: # 'binary' or 'ternary'
+            self.frames = NoiseFrames(ncellswide=ncellswide, ncellshigh=ncellshigh,
+                                      nframes=s.get('nframes', 2**16-1),
+                                      nlevels={'binary': 2, 'ternary': 3}[s.noise],
+                                      seed=self.rng.seed)
+        self.ncellswide, self.ncellshigh = ncellswide, ncellshigh
+        self.nframes = len(self.frames)
+        self.nchannels = 1 # noise is greyscale
+        self.f = None # no movie file
+
+    def readheader(self):
+        """Open the movie file and read its header, if any"""
         self.f = file(self.static.fname, 'rb') # open the movie file for reading in binary format
-        headerstring = self.f.read(5)
-        if headerstring == 'movie': # a header has been added to the start of the file
-            self.ncellswide, = struct.unpack('H', self.f.read(2)) # 'H'== unsigned short int
-            self.ncellshigh, = struct.unpack('H', self.f.read(2))
-            self.nframes, = struct.unpack('H', self.f.read(2))
-            if self.nframes == 0: # this was used in Cat 15 mseq movies to indicate 2**16 frames, shouldn't really worry about this, cuz we're using slightly modified mseq movies now that don't have the extra frame at the end that the Cat 15 movies had (see comment in Experiment module), and therefore never have a need to indicate 2**16 frames
-                self.nframes = 2**16
-            self.offset = self.f.tell() # header is 11 bytes long
-        else: # there's no header at the start of the file, set the file pointer back to the beginning and use these hard coded values:
-            self.f.seek(0)
-            self.ncellswide = self.ncellshigh = 64
-            self.nframes = 6000
-            self.offset = self.f.tell() # header is 0 bytes long
-        self.framesize = self.ncellshigh*self.ncellswide
+        self.ncellswide, self.ncellshigh, self.nframes, self.nchannels, self.offset = readheader(self.f)
+        self.frameshape = frameshape(self.ncellswide, self.ncellshigh, self.nchannels)
+        self.framesize = self.ncellshigh*self.ncellswide*self.nchannels
+
+    def checkfile(self):
+        """Check that the size of the movie file matches its header, without loading any frames"""
+        self.readheader()
+        self.f.close()
+        checksize(self.static.fname, self.offset, self.nframes, self.framesize)
+
+    def load(self, asarray=False, flip=True, frameis=None):
+        """Load movie frames. If a sorted list of frame indices frameis is given, and it doesn't
+        cover the whole movie, load only those frames, into a dict indexed by frame index"""
+        self.readheader()
+
+        if frameis != None and len(frameis) < self.nframes:
+            assert frameis[-1] <= self.nframes-1, 'Frame indices exceed movie size of %d frames' % self.nframes
+            self._loadframes(frameis, flip=flip)
+            info('Loaded %d of %d movie frames, the rest are never displayed' % (len(frameis), self.nframes))
+            self.f.close()
+            return
 
         # read in all of the frames
         # maybe check first to see if file is > 1GB, if so, _loadaslist() to prevent trying to allocate one huge piece of contiguous memory and raising a MemoryError, or worse, segfaulting
@@ -76,15 +239,25 @@ class Movie(Experiment):
 
     def _loadasarray(self, flip=True):
         self.frames = np.fromfile(self.f, dtype=np.uint8, count=self.nframes*self.framesize)
-        self.frames.shape = (self.nframes, self.ncellshigh, self.ncellswide)
+        self.frames.shape = (self.nframes,) + self.frameshape
         if flip:
             self.frames = self.frames[::, ::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
 
+    def _loadframes(self, frameis, flip=True):
+        self.frames = {}
+        for framei in frameis: # in order, so seeks only ever go forward
+            self.f.seek(self.offset + framei*self.framesize)
+            frame = np.fromfile(self.f, dtype=np.uint8, count=self.framesize)
+            frame.shape = self.frameshape
+            if flip:
+                frame = frame[::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
+            self.frames[framei] = frame
+
     def _loadaslist(self, flip=True):
         self.frames = []
         for framei in xrange(self.nframes): # one frame at a time...
             frame = np.fromfile(self.f, dtype=np.uint8, count=self.framesize) # load the next frame
-            frame.shape = (self.ncellshigh, self.ncellswide)
+            frame.shape = self.frameshape
             if flip:
                 frame = frame[::-1, ::] # flip all frames vertically for OpenGL's bottom left origin
             self.frames.append(frame)
@@ -98,35 +271,76 @@ class Movie(Experiment):
         frame.shape = (self.ncellshigh, self.ncellswide) # is this a safe thing to do? better to use reshape()?
         return frame[::-1, ::] # return it vertically flipped
     '''
-    def createstimuli(self):
-        """Creates the VisionEgg stimuli objects for this Experiment subclass"""
-        super(Movie, self).createstimuli()
-
-        # Create an instance of the Mask2D class
-        if self.static.mask:
+    def getmask(self, widthDeg, heightDeg):
+        """Return a Mask2D for a movie of size widthDeg by heightDeg on screen, or None if
+        static.mask is None. Masks are cached, one per size"""
+        if not self.static.mask:
+            return None
+        if (widthDeg, heightDeg) not in self.masks:
             self.nmasksamples = 512  # number of samples in mask, must be power of 2, quality/performance tradeoff
-            samplesperpix = self.nmasksamples / deg2pix(min(self.static.widthDeg, self.static.heightDeg))
+            samplesperpix = self.nmasksamples / deg2pix(min(widthDeg, heightDeg))
             radius = deg2pix(self.static.diameterDeg / 2) # in pix
             radiusSamples = samplesperpix * radius # in mask samples
-            self.mask2d = Mask2D(function=self.static.mask,
+            self.masks[(widthDeg, heightDeg)] = Mask2D(function=self.static.mask,
                                  radius_parameter=radiusSamples, # sigma for gaussian, radius for circle, in units of mask samples
                                  num_samples=(self.nmasksamples, self.nmasksamples)) # size of mask texture data (# of texels)
-        else:
-            self.mask2d = None
-
-        self.texture = Texture(self.frames[self.st.framei[0]]) # init texture to frame of first sweep in sweep table
-
-        self.texturestimulus = TextureStimulus(texture=self.texture,
-                                               position=(self.xorig, self.yorig), # init to orig
-                                               anchor='center',
-                                               # texture is scaled to this size:
-                                               size=(deg2pix(self.static.widthDeg), deg2pix(self.static.heightDeg)),
-                                               mask=self.mask2d,
-                                               max_alpha=1.0,
-                                               mipmaps_enabled=False, # ?
-                                               texture_min_filter=gl.GL_NEAREST, # ?
-                                               texture_mag_filter=gl.GL_NEAREST, # ?
-                                               on=False) # leave it off for now
+        return self.masks[(widthDeg, heightDeg)]
+
+    def getlut(self, nchannels, invert):
+        """Return the lookup table for movies with nchannels channels, at polarity invert, or
+        None if frames can be uploaded as they are. Lookup tables are cached"""
+        key = nchannels, bool(invert)
+        if key not in self.luts:
+            gamma, contrast = self.static.get('lutgamma'), self.static.get('lutcontrast', 1)
+            if gamma or contrast != 1 or invert:
+                self.luts[key] = makelut(nchannels, gamma=gamma, contrast=contrast, invert=invert)
+            else:
+                self.luts[key] = None # identity
+        return self.luts[key]
+
+    def createtexturestimulus(self, ncellswide, ncellshigh, nchannels, widthDeg, heightDeg):
+        """Return a dictattr with a TextureStimulus for movies ncellswide by ncellshigh cells in
+        size with nchannels channels, shown widthDeg by heightDeg on screen, its texture object,
+        and the buffers that frames get passed through the lookup tables in"""
+        shape = frameshape(ncellswide, ncellshigh, nchannels)
+        texture = Texture(np.zeros(shape, dtype=np.uint8)) # frames get uploaded as needed
+        texturestimulus = TextureStimulus(texture=texture,
+                                          position=(self.xorig, self.yorig), # init to orig
+                                          anchor='center',
+                                          # texture is scaled to this size:
+                                          size=(deg2pix(widthDeg), deg2pix(heightDeg)),
+                                          mask=self.getmask(widthDeg, heightDeg),
+                                          max_alpha=1.0,
+                                          mipmaps_enabled=False, # ?
+                                          texture_min_filter=gl.GL_NEAREST, # ?
+                                          texture_mag_filter=gl.GL_NEAREST, # ?
+                                          on=False) # leave it off for now
+        tsp = texturestimulus.parameters
+        return dictattr(stimulus=texturestimulus, tsp=tsp, to=tsp.texture.get_texture_object(),
+                        glformat=GLFORMATS[nchannels],
+                        chanoffsets=np.arange(nchannels)*256, # of each channel's lookup table
+                        lutis=np.zeros(shape, dtype=np.intp), # lookup table indices
+                        buf=np.zeros(shape, dtype=np.uint8), # frame after lookup
+                        frameid=None) # (movie index, frame index, invert) of the frame last uploaded
+
+    def createstimuli(self):
+        """Creates the VisionEgg stimuli objects for this Experiment subclass"""
+        super(Movie, self).createstimuli()
+
+        # Create a pool of texture stimuli, one per movie size in cells and on screen, and
+        # point each movie at the one it uses
+        self.masks = {}
+        self.luts = {}
+        pool = {}
+        self.texturestimuli = [] # in order of creation
+        for moviei, movie in enumerate(self.movies):
+            key = (movie.ncellswide, movie.ncellshigh, movie.nchannels,
+                   permovie(self.static.widthDeg, moviei), permovie(self.static.heightDeg, moviei))
+            if key not in pool:
+                pool[key] = self.createtexturestimulus(*key)
+                self.texturestimuli.append(pool[key].stimulus)
+            movie.tex = pool[key]
+        self.tex = self.movies[self.getmoviei(0)].tex # texture stimulus currently in use
 
         self.fixationspot = ve.Core.FixationSpot(position=(self.xorig, self.yorig),
                                                  anchor='center',
@@ -134,31 +348,41 @@ class Movie(Experiment):
                                                  size=(1, 1),
                                                  on=False) # leave it off for now
 
-        self.stimuli = (self.background, self.texturestimulus, self.fixationspot) # last entry will be topmost layer in viewport
+        self.stimuli = (self.background,) + tuple(self.texturestimuli) + (self.fixationspot,) # last entry will be topmost layer in viewport
 
-        self.tsp = self.texturestimulus.parameters # synonym
-        self.to = self.tsp.texture.get_texture_object()
+        self.tsp = self.tex.tsp # synonym
         self.fsp = self.fixationspot.parameters
 
     def updateparams(self, i):
         """Updates stimulus parameters, given sweep table index i"""
         if i == None: # do a blank sweep
             self.tsp.on = False # turn off the movie, leave all other parameters unchanged
-            self.postval = C.MAXPOSTABLEINT # posted to DT port to indicate a blank sweep
+            self.postval = self.blankpostval # posted to DT port to indicate a blank sweep
             self.nvsyncs = sec2intvsync(self.blanksweeps.sec) # this many vsyncs for this sweep
             self.npostvsyncs = 0 # this many post-sweep vsyncs for this sweep, blank sweeps have no post-sweep delay
         else: # not a blank sweep
+            moviei = self.getmoviei(i)
+            movie = self.movies[moviei]
+            if movie.tex is not self.tex: # switch to the texture stimulus this movie uses
+                self.tsp.on = False
+                self.tex = movie.tex
+                self.tsp = self.tex.tsp
             self.tsp.on = True # ensure texture stimulus is on
             self.postval = i # sweep table index will be posted to DT port
             self.nvsyncs = sec2intvsync(self.st.sweepSec[i]) # this many vsyncs for this sweep
             self.npostvsyncs = sec2intvsync(self.st.postsweepSec[i]) # this many post-sweep vsyncs for this sweep
 
-            # Update texture
-            frame = self.frames[self.st.framei[i]] # get the frame for this sweep
-            #frame = self[self.st.framei[i]] # get the frame for this sweep
-            if self.st.invert[i]:
-                frame = 255 - frame # give the frame inverted polarity
-            self.to.put_sub_image(frame, data_format=gl.GL_LUMINANCE, data_type=gl.GL_UNSIGNED_BYTE)
+            # Update texture, unless it already holds this sweep's frame, at this sweep's polarity
+            frameid = moviei, self.st.framei[i], self.st.invert[i]
+            if frameid != self.tex.frameid:
+                frame = movie.frames[self.st.framei[i]] # get the frame for this sweep
+                #frame = self[self.st.framei[i]] # get the frame for this sweep
+                lut = self.getlut(movie.nchannels, self.st.invert[i])
+                if lut is not None: # look up each cell in its channel's table, in place in the buffers
+                    np.add(frame, self.tex.chanoffsets, self.tex.lutis)
+                    frame = lut.take(self.tex.lutis, out=self.tex.buf, mode='clip') # indices are in range, and 'raise' would copy via a temporary
+                self.tex.to.put_sub_image(frame, data_format=self.tex.glformat, data_type=gl.GL_UNSIGNED_BYTE)
+                self.tex.frameid = frameid
 
             # Update texturestimulus
             self.tsp.angle = self.static.orioff + self.st.ori[i]
@@ -183,23 +407,26 @@ class Movie(Experiment):
         """
         for ii, i in enumerate(self.sweeptable.i):
 
+            if ii < self.startii:
+                continue # already displayed before being interrupted, see Resume.py
+            self.sweepii = ii # current position in the sweep sequence
             self.updateparams(i)
 
             # Set sweep bit high, do the sweep
-            for vsynci in xrange(self.nvsyncs): # nvsyncs depends on if this is a blank sweep or not
-                for event in pygame.event.get(): # for all events in the event queue
-                    if event.type == pygame.locals.KEYDOWN:
-                        if event.key == pygame.locals.K_ESCAPE:
-                            self.quit = True
+            vsynci = 0 # always display and post the first vsync, even of a late sweep, see skip()
+            while vsynci < self.nvsyncs: # nvsyncs depends on if this is a blank sweep or not
+                if self.input.poll(): # ESC has been hit
+                    self.quit = True
                 if self.quit:
                     break # out of vsync loop
-                if I.DTBOARDINSTALLED: DT.postInt16(self.postval) # post value to port
+                if I.DTBOARDINSTALLED: self.postInt(self.postval) # post value to port
                 self.screen.clear()
                 self.viewport.draw()
                 ve.Core.swap_buffers() # returns immediately
                 gl.glFlush() # waits for next vsync pulse from video card
                 self.vsynctimer.tick()
                 self.nvsyncsdisplayed += 1 # increment
+                vsynci = self.skip(vsynci + 1, self.nvsyncs)
 
             # Sweep's done, turn off the texture stimulus, do the postsweep delay, clear sweep bit low
             self.tsp.on = False
@@ -209,5 +436,10 @@ class Movie(Experiment):
                 self.ii = ii + 1 - 1 # dec for accurate count of nsweeps successfully displayed
                 break # out of sweep loop
 
+            self.checkpoint(ii + 1) # save progress every so often
+
         self.ii = ii + 1 # nsweeps successfully displayed
-        self.f.close() # close the movie file
+        if self.f:
+            self.f.close() # close the movie file
+        if isinstance(getattr(self, 'frames', None), Frames):
+            self.frames.close() # stop generating noise frames
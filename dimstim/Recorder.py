@@ -0,0 +1,91 @@
+"""Defines the Recorder class, for recording the trajectory of a manual stimulus to disk"""
+
+from __future__ import division
+
+import time
+import threading
+import Queue
+
+import numpy as np
+
+MAGIC = 'dimstim trajectory\n' # first line of every .traj file
+
+# one record per vsync. t is time.clock() time, the same clock as VsyncTimer's. Params that
+# don't apply to the stimulus being recorded (like tfreq for a bar) are NaN
+DTYPE = np.dtype([('t', np.float64), # (sec)
+                  ('vsynci', np.int64),
+                  ('xDeg', np.float32), # from screen center
+                  ('yDeg', np.float32),
+                  ('ori', np.float32), # (deg)
+                  ('widthDeg', np.float32),
+                  ('heightDeg', np.float32),
+                  ('brightness', np.float32), # (0-1)
+                  ('bgbrightness', np.float32), # (0-1)
+                  ('on', np.bool_), # stimulus on, ie flash state
+                  ('tfreqCycSec', np.float32),
+                  ('sfreqCycDeg', np.float32),
+                  ('contrast', np.float32)])
+
+
+class Recorder(object):
+    """Records one record per vsync into a preallocated structured array of chunklen
+    records. Full chunks are handed off to a background thread that appends them to binary
+    file fname, while recording carries on in a spare chunk. Chunks are recycled, so nothing
+    gets allocated on the vsync loop's side. The file starts with MAGIC, followed by a line
+    with the record dtype, and then the records, see load()"""
+    def __init__(self, fname, chunklen=1024, nchunks=4):
+        self.fname = fname
+        self.f = open(fname, 'wb')
+        self.f.write(MAGIC)
+        self.f.write(repr(DTYPE.descr) + '\n')
+        self.free = Queue.Queue() # chunks ready to be recorded into
+        for chunki in range(nchunks):
+            self.free.put(np.zeros(chunklen, dtype=DTYPE))
+        self.full = Queue.Queue() # chunks waiting to be written to disk
+        self.chunk = self.free.get()
+        self.i = 0 # index into self.chunk of the next record
+        self.n = 0 # number of records so far
+        self.writer = threading.Thread(target=self.write)
+        self.writer.setDaemon(True) # don't hang on exit if recording is never closed
+        self.writer.start()
+
+    def add(self, vsynci, xDeg, yDeg, ori, widthDeg, heightDeg, brightness, bgbrightness, on,
+            tfreqCycSec=np.nan, sfreqCycDeg=np.nan, contrast=np.nan):
+        """Record the state of the stimulus on vsync vsynci, timestamped with time.clock()"""
+        self.chunk[self.i] = (time.clock(), vsynci, xDeg, yDeg, ori, widthDeg, heightDeg,
+                              brightness, bgbrightness, on, tfreqCycSec, sfreqCycDeg, contrast)
+        self.i += 1
+        self.n += 1
+        if self.i == len(self.chunk): # hand it off, switch to a spare one
+            self.full.put((self.chunk, self.i))
+            try:
+                self.chunk = self.free.get_nowait()
+            except Queue.Empty: # writer's falling behind, don't wait for it
+                self.chunk = np.zeros(len(self.chunk), dtype=DTYPE)
+            self.i = 0
+
+    def write(self):
+        """Write full chunks to disk as they come in, until told to stop. Runs in the background"""
+        while True:
+            chunk, n = self.full.get()
+            if chunk is None: # can't use == on an array
+                break
+            chunk[:n].tofile(self.f)
+            self.free.put(chunk)
+
+    def close(self):
+        """Write out whatever's been recorded, and close the file"""
+        self.full.put((self.chunk, self.i))
+        self.full.put((None, 0)) # tell the writer to stop
+        self.writer.join()
+        self.f.close()
+
+
+def load(fname):
+    """Return the records in .traj file fname as a structured array"""
+    f = open(fname, 'rb')
+    assert f.readline() == MAGIC, '%s is not a dimstim trajectory file' % fname
+    dtype = np.dtype(eval(f.readline()))
+    records = np.fromstring(f.read(), dtype=dtype)
+    f.close()
+    return records
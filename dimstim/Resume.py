@@ -0,0 +1,47 @@
+"""Resume an interrupted Experiment from the last sweep it completed. While an Experiment is
+displayed, its progress is saved every so often to a .checkpoint file next to its text header.
+The text header holds everything needed to rebuild the exact same sweep sequence, including
+the random seed, so the sweep table is rebuilt from it and display picks up where it left off.
+The resumed Experiment gets a text header of its own, which references the interrupted one.
+From the command line:
+
+>>> python -m dimstim.Resume script_datetime.checkpoint
+"""
+
+from __future__ import division
+
+import sys
+
+from Experiment import loadscript, info
+
+
+def loadcheckpoint(fname):
+    """Return the dict of progress saved in .checkpoint file fname"""
+    f = open(fname, 'r')
+    checkpoint = eval(f.read())
+    f.close()
+    return checkpoint
+
+def resume(fname):
+    """Resume the Experiment whose progress was saved in .checkpoint file fname"""
+    cp = loadcheckpoint(fname)
+    if cp['ii'] >= cp['nsweeps']:
+        info('%s already displayed all %d sweeps, nothing to resume' % (cp['textheader'], cp['nsweeps']))
+        return
+    experiments = []
+    for e in loadscript(cp['textheader']):
+        if type(e).__name__ == cp['experiment'] and e not in experiments: # the same one may be run more than once
+            experiments.append(e)
+    if len(experiments) != 1:
+        raise ValueError, 'found %d %s Experiments in %s, need exactly 1 to resume' % (len(experiments), cp['experiment'], cp['textheader'])
+    e = experiments[0]
+    e.static.seed = cp['seed'] # in case the text header predates the seed being saved in it
+    e.startii = cp['ii']
+    e.resumeof = cp['textheader']
+    info('Resuming %s from sweep %d of %d' % (cp['textheader'], cp['ii'], cp['nsweeps']))
+    e.run()
+    return e
+
+
+if __name__ == '__main__':
+    resume(sys.argv[1])
@@ -0,0 +1,136 @@
+"""Defines the Session class, for running multiple Experiment scripts back to back"""
+
+from __future__ import division
+
+import sys
+import time
+import threading
+from collections import deque
+
+import pygame
+import VisionEgg as ve
+import VisionEgg.Core
+
+import Constants as C
+from Constants import I
+import Control
+from Experiment import loadscript, info, warning
+
+
+class Builder(threading.Thread):
+    """Loads, checks and builds all the Experiments defined in a script, in a background thread"""
+    def __init__(self, script):
+        threading.Thread.__init__(self)
+        self.setDaemon(True) # don't hang on exit if the Session is interrupted
+        self.script = script
+        self.experiments = []
+        self.exc_info = None # (type, value, traceback) of any exception raised while building
+
+    def run(self):
+        try:
+            self.experiments = loadscript(self.script)
+            for e in self.experiments:
+                if not hasattr(e, 'static'):
+                    raise ValueError, '%s in script %s is a manual experiment, and cannot be run in a Session' % (type(e).__name__, self.script)
+                e.check()
+                e.deferheader = True # timestamp the text header right before display instead
+                e.build() # builds SweepTable, loads movie frames, etc.
+        except:
+            self.exc_info = sys.exc_info()
+
+    def get(self):
+        """Wait for the build to finish, and return the built Experiments"""
+        self.join()
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.experiments
+
+
+class Session(object):
+    """Runs a sequence of Experiment scripts back to back on a single VisionEgg screen.
+    While one Experiment is being displayed, the next script is loaded, checked and built
+    (SweepTable, duration estimate, movie frames) in a background thread, so the gap
+    between Experiments is only that of creating the next one's stimuli.
+    Hitting ESC ends the current Experiment and all those queued to follow it.
+    If a control server is enabled in dimstim.cfg, more scripts can be queued while the
+    Session is running (see Control.py). If wait is set, the Session then waits for more
+    scripts once its queue runs out, until told to quit"""
+    def __init__(self, scripts, wait=False):
+        self.queue = deque(scripts) # Experiment script file names, run in order
+        self.wait = wait
+        self.experiment = None # Experiment currently being displayed
+        self.screen = None
+        self.viewport = None # kept alive across Experiments, each swaps in its own stimuli
+        self.control = None
+        self.quit = False
+
+    def enqueue(self, script):
+        """Add script to the end of the queue. Called from the control server's thread"""
+        self.queue.append(script) # deque appends are atomic, no need for a lock
+
+    def status(self):
+        """Return a dict of progress so far, for the control server"""
+        status = {'queue': list(self.queue), 'experiment': None}
+        if self.experiment:
+            status['experiment'] = self.experiment.status()
+        return status
+
+    def post(self, request):
+        """Handle a request from the control server, the same way as hitting ESC. Called from
+        the control server's thread"""
+        if request['cmd'] != 'quit':
+            raise ValueError, "Session can't %s" % request['cmd']
+        self.quit = True
+        if self.experiment:
+            self.experiment.quit = True # picked up by its vsync loop
+
+    def nextbuilder(self):
+        """Start building the next script in the queue in the background, if there is one"""
+        if self.queue:
+            builder = Builder(self.queue.popleft())
+            builder.start()
+            return builder
+
+    def run(self):
+        """Run all the scripts in the queue"""
+        if I.CONTROL:
+            self.control = Control.Server(I.CONTROL, self)
+            self.control.start()
+        builder = None
+        while not self.quit:
+            if builder == None:
+                builder = self.nextbuilder() # scripts may have been queued in the meantime
+            if builder == None: # queue has run out
+                if not self.wait:
+                    break
+                if self.screen:
+                    pygame.event.pump() # keep the screen responsive while waiting
+                time.sleep(0.1)
+                continue
+            experiments = builder.get()
+            builder = self.nextbuilder() # build the next one while this one is being displayed
+            for e in experiments:
+                info('Running Experiment script: %s' % e.script)
+                if self.screen == None:
+                    e.setgamma(e.static.gamma) # has to be set before the screen is initialized
+                    self.gamma = e.static.gamma
+                    self.screen = ve.Core.get_default_screen()
+                    self.viewport = ve.Core.Viewport(screen=self.screen)
+                elif e.static.gamma != self.gamma:
+                    warning('gamma %r of %s differs from that of the first Experiment in this '
+                            'Session, using %r instead' % (e.static.gamma, e.script, self.gamma))
+                e.buildheader()
+                e.screen = self.screen
+                e.session = self # so display() can pick up a quit posted before it starts
+                self.experiment = e
+                e.display()
+                e.report()
+                if e.quit or self.quit:
+                    self.quit = True
+                    break # out of experiment loop
+        if self.control:
+            self.control.close()
+        if self.screen:
+            self.screen.close() # necessary when running from Python interpreter
+        if self.quit:
+            warning('Session was interrupted, %d scripts were not run' % len(self.queue))
@@ -6,7 +6,6 @@ import math
 from math import pi
 import numpy as np
 np.seterr(all='raise') # raise all numpy errors (like 1/0), don't just warn
-import pygame
 import OpenGL.GL as gl
 
 import VisionEgg as ve
@@ -65,7 +64,7 @@ class SparseNoise(Experiment):
         """Updates stimulus parameters, given sweep table index i"""
         if i == None: # do a blank sweep
             self.tp.on = False # turn off the target, leave all other parameters unchanged
-            self.postval = C.MAXPOSTABLEINT # posted to DT port to indicate a blank sweep
+            self.postval = self.blankpostval # posted to DT port to indicate a blank sweep
             self.nvsyncs = sec2intvsync(self.blanksweeps.sec) # this many vsyncs for this sweep
             self.npostvsyncs = 0 # this many post-sweep vsyncs for this sweep, blank sweeps have no post-sweep delay
         else: # not a blank sweep
@@ -107,23 +106,26 @@ class SparseNoise(Experiment):
         """
         for ii, i in enumerate(self.sweeptable.i):
 
+            if ii < self.startii:
+                continue # already displayed before being interrupted, see Resume.py
+            self.sweepii = ii # current position in the sweep sequence
             self.updateparams(i)
 
             # Set sweep bit high, do the sweep
-            for vsynci in xrange(self.nvsyncs): # nvsyncs depends on if this is a blank sweep or not
-                for event in pygame.event.get(): # for all events in the event queue
-                    if event.type == pygame.locals.KEYDOWN:
-                        if event.key == pygame.locals.K_ESCAPE:
-                            self.quit = True
+            vsynci = 0 # always display and post the first vsync, even of a late sweep, see skip()
+            while vsynci < self.nvsyncs: # nvsyncs depends on if this is a blank sweep or not
+                if self.input.poll(): # ESC has been hit
+                    self.quit = True
                 if self.quit:
                     break # out of vsync loop
-                if I.DTBOARDINSTALLED: DT.postInt16(self.postval) # post value to port
+                if I.DTBOARDINSTALLED: self.postInt(self.postval) # post value to port
                 self.screen.clear()
                 self.viewport.draw()
                 ve.Core.swap_buffers() # returns immediately
                 gl.glFlush() # waits for next vsync pulse from video card
                 self.vsynctimer.tick()
                 self.nvsyncsdisplayed += 1 # increment
+                vsynci = self.skip(vsynci + 1, self.nvsyncs)
 
             # Sweep's done, turn off the target, do the postsweep delay, clear sweep bit low
             self.tp.on = False
@@ -133,4 +135,6 @@ class SparseNoise(Experiment):
                 self.ii = ii + 1 - 1 # dec for accurate count of nsweeps successfully displayed
                 break # out of sweep loop
 
+            self.checkpoint(ii + 1) # save progress every so often
+
         self.ii = ii + 1 # nsweeps successfully displayed
@@ -0,0 +1,133 @@
+"""Live vsync timing telemetry over UDP. A Publisher, hooked into an Experiment's VsyncTimer,
+sends one datagram per second with aggregate timing stats for that second, plus a line for each
+vsync dropped during it. Sending never blocks, and nothing is sent in between. To watch the
+telemetry on any machine the publisher is set to send to (see [Telemetry] in dimstim.cfg):
+
+>>> python Telemetry.py [port]
+
+This module only uses the standard library, so the viewer can be run straight from this file,
+without installing dimstim or VisionEgg"""
+
+from __future__ import division
+
+import sys
+import time
+import socket
+
+PORT = 9999 # default viewer port
+
+
+class Publisher(object):
+    """Collects vsync timing stats from a VsyncTimer, and publishes them to address (host, port)
+    every interval sec. experiment is checked for its current sweep index and postval"""
+    def __init__(self, address, experiment=None, interval=1.0):
+        self.address = address
+        self.experiment = experiment
+        self.interval = interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.nlost = 0 # number of datagrams that couldn't be sent
+        self.lastflush = None
+        self.reset()
+
+    def reset(self):
+        """Reset the aggregate stats for the next interval"""
+        self.n = 0
+        self.sumIVI = 0.0
+        self.minIVI = None
+        self.maxIVI = None
+        self.ndrops = 0
+        self.lines = [] # drop event lines waiting to be sent
+
+    def tick(self, now, IVI, vsynci, dropped):
+        """Count a vsync's IVI, ending at time.clock() time now. Called from VsyncTimer.tick()"""
+        if self.lastflush == None:
+            self.lastflush = now
+        self.n += 1
+        self.sumIVI += IVI
+        if self.minIVI == None or IVI < self.minIVI:
+            self.minIVI = IVI
+        if self.maxIVI == None or IVI > self.maxIVI:
+            self.maxIVI = IVI
+        if dropped:
+            self.ndrops += 1
+            ii, postval = self.getsweep()
+            self.lines.append('drop t=%.3f vsynci=%d IVI=%.3f ii=%s postval=%s'
+                              % (time.time(), vsynci, IVI*1000, ii, postval))
+        if now - self.lastflush >= self.interval:
+            self.flush()
+            self.lastflush = now
+
+    def getsweep(self):
+        """Return the Experiment's current position in the sweep sequence, and its current postval"""
+        e = self.experiment # synonym
+        return getattr(e, 'sweepii', None), getattr(e, 'postval', None)
+
+    def flush(self):
+        """Send the aggregate stats and any drop events as a single datagram, and reset"""
+        if self.n:
+            ii, postval = self.getsweep()
+            self.lines.append('stats t=%.3f n=%d minIVI=%.3f meanIVI=%.3f maxIVI=%.3f ndrops=%d ii=%s postval=%s'
+                              % (time.time(), self.n, self.minIVI*1000, self.sumIVI/self.n*1000,
+                                 self.maxIVI*1000, self.ndrops, ii, postval))
+            try:
+                self.sock.sendto('\n'.join(self.lines), self.address)
+            except socket.error: # buffer full, or nobody listening, don't wait around
+                self.nlost += 1
+        self.reset()
+
+    def close(self):
+        """Send whatever's left and close the socket"""
+        self.flush()
+        self.sock.close()
+
+
+def parse(line):
+    """Parse a telemetry line into its kind ('stats' or 'drop') and a dict of its fields"""
+    fields = line.split()
+    kind = fields[0]
+    d = {}
+    for field in fields[1:]:
+        name, val = field.split('=', 1)
+        if val == 'None':
+            val = None
+        else:
+            try:
+                val = int(val)
+            except ValueError:
+                val = float(val)
+        d[name] = val
+    return kind, d
+
+def formatline(kind, d):
+    """Return a telemetry line's fields formatted for display"""
+    t = time.strftime('%H:%M:%S', time.localtime(d['t']))
+    if kind == 'stats':
+        return ('%s %4d vsyncs, (min, mean, max) IVI: (%.2f, %.2f, %.2f) ms, %d dropped, sweep %s, postval %s'
+                % (t, d['n'], d['minIVI'], d['meanIVI'], d['maxIVI'], d['ndrops'], d['ii'], d['postval']))
+    return ('%s *** dropped vsync %d, IVI: %.2f ms, sweep %s, postval %s'
+            % (t, d['vsynci'], d['IVI'], d['ii'], d['postval']))
+
+def view(port=PORT, host=''):
+    """Print telemetry received on port as it comes in, until interrupted"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    print 'Listening for dimstim telemetry on port %d, hit Ctrl+C to quit' % port
+    try:
+        while True:
+            data, address = sock.recvfrom(65535)
+            for line in data.splitlines():
+                try:
+                    print formatline(*parse(line))
+                except (ValueError, KeyError, IndexError): # not a telemetry line
+                    print 'unrecognized telemetry from %s: %r' % (address[0], line)
+    except KeyboardInterrupt:
+        pass
+    sock.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        view(port=int(sys.argv[1]))
+    else:
+        view()
@@ -0,0 +1,108 @@
+"""Pre-flight validation of Experiment scripts. Checks and builds each script without displaying
+anything, in a pool of processes, and prints a table of the results. From the command line:
+
+>>> python -m dimstim.Validate script1.py script2.py ...
+"""
+
+from __future__ import division
+
+import sys
+try:
+    import multiprocessing # only available in Python >= 2.6
+except ImportError:
+    multiprocessing = None
+
+import Constants as C
+from Core import dictattr, isotime
+from Experiment import loadscript
+
+printer = C.printer # synonym
+info = printer.info
+
+COLUMNS = [('script', 'script', '%s'),
+           ('name', 'experiment', '%s'),
+           ('nconditions', 'conditions', '%d'),
+           ('nsweeps', 'sweeps', '%d'),
+           ('sec', 'duration', None), # formatted with isotime
+           ('headerlen', 'header (bytes)', '%d'),
+           ('error', 'error', '%s')]
+
+
+def errorstring(err):
+    """Return a one line description of exception err"""
+    return '%s: %s' % (type(err).__name__, str(err).replace('\n', ' '))
+
+def validatescript(fname):
+    """Check and build all the Experiments defined in script fname, without displaying or
+    saving anything. Return a list of results, one dictattr per Experiment"""
+    try:
+        experiments = loadscript(fname)
+    except Exception, err:
+        return [dictattr(script=fname, name=None, nconditions=None, nsweeps=None, sec=None,
+                         headerlen=None, error=errorstring(err))]
+    if not experiments:
+        return [dictattr(script=fname, name=None, nconditions=None, nsweeps=None, sec=None,
+                         headerlen=None, error='no Experiment found in script')]
+    results = []
+    for e in experiments:
+        r = dictattr(script=fname, name=type(e).__name__, nconditions=None, nsweeps=None,
+                     sec=None, headerlen=None, error=None)
+        results.append(r)
+        if not hasattr(e, 'static'): # manual experiments like ManBar have nothing to build
+            continue
+        try:
+            e.dryrun = True
+            e.check()
+            e.build()
+            r.nconditions = e.sweeptable.nconditions
+            r.nsweeps = len(e.sweeptable.i)
+            r.sec = e.sec
+            r.headerlen = len(str(e.header.text))
+        except Exception, err:
+            r.error = errorstring(err)
+    return results
+
+def validate(fnames, nprocesses=None):
+    """Validate all the scripts in fnames in parallel, print a table of the results,
+    and return them as a list of dictattrs. nprocesses defaults to the number of CPUs"""
+    if multiprocessing and len(fnames) > 1:
+        pool = multiprocessing.Pool(processes=nprocesses)
+        resultslist = pool.map(validatescript, fnames, chunksize=1) # preserves order
+        pool.close()
+        pool.join()
+    else:
+        resultslist = map(validatescript, fnames)
+    results = []
+    for r in resultslist:
+        results.extend(r)
+    info(pformat(results))
+    return results
+
+def pformat(results):
+    """Return the validation results formatted as a table"""
+    rows = [[ label for key, label, fmt in COLUMNS ]]
+    for r in results:
+        row = []
+        for key, label, fmt in COLUMNS:
+            val = r[key]
+            if val == None:
+                row.append('')
+            elif fmt == None:
+                row.append(isotime(val, 3))
+            else:
+                row.append(fmt % val)
+        rows.append(row)
+    widths = [ max([ len(row[coli]) for row in rows ]) for coli in range(len(COLUMNS)) ]
+    lines = []
+    for row in rows:
+        lines.append('  '.join([ val.ljust(width) for val, width in zip(row, widths) ]).rstrip())
+    nerrors = len([ r for r in results if r.error ])
+    lines.append('%d experiments in %d scripts, %d with errors, %s total duration'
+                 % (len(results), len(set([ r.script for r in results ])), nerrors,
+                    isotime(sum([ r.sec for r in results if r.sec != None ]), 3)))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    results = validate(sys.argv[1:])
+    sys.exit(len([ r for r in results if r.error ]) > 0)
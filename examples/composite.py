@@ -0,0 +1,109 @@
+"""Runs a Composite experiment: a drifting grating centered on the RF, flanked by a pair of
+stationary bars, each of which can be on or off"""
+
+from dimstim.Constants import dc # dimstim config
+from dimstim.Core import StaticParams, DynamicParams, Variable, Variables, Runs, BlankSweeps
+from dimstim.Composite import Composite, GratingComponent, BarComponent
+
+s = StaticParams()
+d = DynamicParams()
+
+"""Static parameters always remain constant during the entire experiment. Params specific to
+a Component are prefixed with its name"""
+
+# pre-experiment duration to display blank screen (sec)
+s.preexpSec = 1
+# post-experiment duration to display blank screen (sec)
+s.postexpSec = 1
+# x coord of stimulus center relative to screen center (deg)
+s.xorigDeg = dc.get('Manbar0', 'xorigDeg')
+# y coord of stimulus center relative to screen center (deg)
+s.yorigDeg = dc.get('Manbar0', 'yorigDeg')
+# screen gamma: None, or single value, or 3-tuple
+s.gamma = dc.get('Screen', 'gamma')
+
+# center grating width (deg)
+s.center_widthDeg = 10
+# center grating height (deg)
+s.center_heightDeg = 10
+# center grating orientation offset (deg)
+s.center_orioff = dc.get('Manbar0', 'orioff')
+# center grating mask, one of:  None, 'gaussian', or 'circle'
+s.center_mask = 'circle'
+
+# left and right bar orientation offsets (deg)
+s.left_orioff = dc.get('Manbar0', 'orioff')
+s.right_orioff = dc.get('Manbar0', 'orioff')
+
+"""Dynamic parameters can potentially vary from one sweep to the next. If a dynamic parameter
+is assigned multiple values in a sequence, it's treated as a Variable, and has to be added to
+this Experiment's Variables object"""
+
+# center grating orientation relative to orioff (deg)
+d.center_ori = range(0, 360, 30)
+# center grating x position relative to origin (deg)
+d.center_xposDeg = 0
+# center grating y position relative to origin (deg)
+d.center_yposDeg = 0
+# center grating mask diameter (deg), ignored if mask is None
+d.center_diameterDeg = 8
+# center grating spatial frequency (cycles/deg)
+d.center_sfreqCycDeg = 0.2
+# center grating temporal frequency (cycles/sec)
+d.center_tfreqCycSec = 2
+# center grating phase to begin each sweep with (+/- deg)
+d.center_phase0 = 0
+# center grating mean luminance (0-1)
+d.center_ml = 0.5
+# center grating contrast (0-1)
+d.center_contrast = 1
+
+# left bar on?
+d.left_on = [False, True]
+# left bar orientation relative to orioff (deg)
+d.left_ori = 0
+# left bar x and y position relative to origin (deg)
+d.left_xposDeg = -8
+d.left_yposDeg = 0
+# left bar width and height (deg)
+d.left_widthDeg = 1
+d.left_heightDeg = 10
+# left bar brightness (0-1)
+d.left_brightness = 1
+
+# right bar on?
+d.right_on = [False, True]
+# right bar orientation relative to orioff (deg)
+d.right_ori = 0
+# right bar x and y position relative to origin (deg)
+d.right_xposDeg = 8
+d.right_yposDeg = 0
+# right bar width and height (deg)
+d.right_widthDeg = 1
+d.right_heightDeg = 10
+# right bar brightness (0-1)
+d.right_brightness = 1
+
+# background brightness (0-1)
+d.bgbrightness = 0.5
+# sweep duration (sec)
+d.sweepSec = 2
+# post-sweep duration to display blank screen (sec)
+d.postsweepSec = 0
+
+vs = Variables()
+vs.center_ori = Variable(vals=d.center_ori, dim=0, shuffle=True) # kwargs: vals, dim, shuffle, random
+vs.left_on = Variable(vals=d.left_on, dim=1, shuffle=True)
+vs.right_on = Variable(vals=d.right_on, dim=2, shuffle=True)
+
+runs = Runs(n=5, reshuffle=True)
+
+#bs = BlankSweeps(T=7, sec=2, shuffle=False) # blank sweep every T sweeps for sec seconds
+
+# Components are drawn in order, the first one at the bottom:
+components = [GratingComponent('center'), BarComponent('left'), BarComponent('right')]
+
+e = Composite(script=__file__, # this script's file name
+              static=s, dynamic=d, variables=vs, components=components,
+              runs=runs, blanksweeps=None) # create a Composite experiment
+e.run() # run it
@@ -0,0 +1,66 @@
+"""Runs a GridNoise experiment"""
+
+from dimstim.Constants import dc # dimstim config
+from dimstim.Core import StaticParams, DynamicParams, Variable, Variables, Runs, BlankSweeps
+from dimstim.GridNoise import GridNoise
+
+s = StaticParams()
+d = DynamicParams()
+
+"""Static parameters always remain constant during the entire experiment"""
+
+# pre-experiment duration to display blank screen (sec)
+s.preexpSec = 1
+# post-experiment duration to display blank screen (sec)
+s.postexpSec = 1
+# grid orientation offset (deg)
+s.orioff = dc.get('Manbar0', 'orioff')
+# grid width (number of cells)
+s.ncellswide = 16
+# grid height (number of cells)
+s.ncellshigh = 16
+# grid width (deg)
+s.widthDeg = 20
+# grid height (deg)
+s.heightDeg = 20
+# type of noise, one of 'sparse', 'binary', 'ternary' or 'mseq'
+s.noise = 'sparse'
+# number of cells lit black or white in each frame of sparse noise, the rest are grey
+s.nlit = 4
+# number of frames of sparse, binary or ternary noise to generate frames from
+s.nframes = 2**16 - 1
+# screen gamma: None, or single value, or 3-tuple
+s.gamma = dc.get('Screen', 'gamma')
+
+"""Dynamic parameters can potentially vary from one sweep to the next. If a dynamic parameter
+is assigned multiple values in a sequence, it's treated as a Variable, and has to be added to
+this Experiment's Variables object"""
+
+# noise frame indices
+d.framei = range(6000)
+# grid orientation relative to orioff (deg)
+d.ori = 0
+# grid x position relative to origin (deg)
+d.xposDeg = 0
+# grid y position relative to origin (deg)
+d.yposDeg = 0
+# invert noise polarity?
+d.invert = False
+# background brightness (0-1)
+d.bgbrightness = 0.5
+# sweep duration (sec)
+d.sweepSec = 0.050
+# post-sweep duration to display blank screen (sec)
+d.postsweepSec = 0
+
+vs = Variables()
+vs.framei = Variable(vals=d.framei, dim=0, shuffle=False) # kwargs: vals, dim, shuffle, random
+
+runs = Runs(n=1, reshuffle=False)
+
+#bs = BlankSweeps(T=7, sec=2, shuffle=False) # blank sweep every T sweeps for sec seconds
+
+e = GridNoise(script=__file__, # this script's file name
+              static=s, dynamic=d, variables=vs,
+              runs=runs, blanksweeps=None) # create a GridNoise experiment
+e.run() # run it
@@ -42,6 +42,11 @@ p.snapDeg = 18
 p.printhistogram = False
 # display on how many screens?
 p.nscreens = 2
+# only wait for vsync on the last screen, so every screen is updated every vsync? Otherwise,
+# each screen waits for its own vsync, dividing the refresh rate by nscreens
+p.fullrate = True
+# record the stimulus trajectory every vsync to a .traj file, for alignment with spikes offline?
+p.record = False
 
 e = ManGrating(script=__file__, # this script's file name
                params=p) # create a ManGrating experiment
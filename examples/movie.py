@@ -12,6 +12,11 @@ d = DynamicParams()
 
 # movie file name with path
 s.fname = os.path.join(dc.get('Path', 'movies'), 'mseq', 'MSEQ32')
+# generate frames on demand instead of loading them from fname? One of None, 'mseq', 'binary'
+# or 'ternary' white noise. Set s.ncellswide and s.ncellshigh for the size of the frames in
+# cells (64 by default), s.mseqtaps and s.mseqshift for the m-sequence's LFSR taps and the
+# shift along the sequence between cells, or s.nframes for the number of white noise frames
+s.noise = None
 # pre-experiment duration to display blank screen (sec)
 s.preexpSec = 0
 # post-experiment duration to display blank screen (sec)
@@ -28,6 +33,11 @@ s.mask = None
 s.diameterDeg = 10
 # screen gamma: None, or single value, or 3-tuple
 s.gamma = None
+# gamma applied to each movie frame through per-channel lookup tables instead of through
+# VisionEgg, for colour movies: None, or single value, or one per channel. Leave s.gamma None
+s.lutgamma = None
+# contrast of each movie frame, about mid grey: single value, or one per channel
+s.lutcontrast = 1
 
 """Dynamic parameters can potentially vary from one sweep to the next. If a dynamic parameter
 is assigned multiple values in a sequence, it's treated as a Variable, and has to be added to
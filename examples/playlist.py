@@ -0,0 +1,73 @@
+"""Runs a Movie experiment that plays a playlist of movies"""
+
+import os
+from dimstim.Constants import dc # dimstim config
+from dimstim.Core import StaticParams, DynamicParams, Variable, Variables, Runs, BlankSweeps
+from dimstim.Movie import Movie
+
+s = StaticParams()
+d = DynamicParams()
+
+"""Static parameters always remain constant during the entire experiment"""
+
+# playlist of movie file names with path, indexed by d.moviei
+s.fname = (os.path.join(dc.get('Path', 'movies'), 'natural', 'CATCAM1'),
+           os.path.join(dc.get('Path', 'movies'), 'natural', 'CATCAM2'),
+           os.path.join(dc.get('Path', 'movies'), 'natural', 'CATCAM3'))
+# pre-experiment duration to display blank screen (sec)
+s.preexpSec = 0
+# post-experiment duration to display blank screen (sec)
+s.postexpSec = 1
+# movie orientation offset (deg)
+s.orioff = 0 #dc.get('Manbar0', 'orioff')
+# movie width (deg), either one for all movies, or a tuple with one per movie in the playlist
+s.widthDeg = 15
+# movie height (deg), either one for all movies, or a tuple with one per movie in the playlist
+s.heightDeg = 15
+# mask, one of:  None, 'gaussian', or 'circle'
+s.mask = None
+# mask diameter (deg), ignored if mask is None
+s.diameterDeg = 10
+# screen gamma: None, or single value, or 3-tuple
+s.gamma = None
+# gamma applied to each movie frame through per-channel lookup tables instead of through
+# VisionEgg, for colour movies: None, or single value, or one per channel. Leave s.gamma None
+s.lutgamma = None
+# contrast of each movie frame, about mid grey: single value, or one per channel
+s.lutcontrast = 1
+
+"""Dynamic parameters can potentially vary from one sweep to the next. If a dynamic parameter
+is assigned multiple values in a sequence, it's treated as a Variable, and has to be added to
+this Experiment's Variables object"""
+
+# movie indices into the playlist
+d.moviei = range(3)
+# movie frame indices, must be within the length of the shortest movie
+d.framei = range(1000)
+# movie orientation relative to orioff (deg)
+d.ori = 0
+# movie x position relative to origin (deg)
+d.xposDeg = 0
+# movie y position relative to origin (deg)
+d.yposDeg = 0
+# invert movie polarity?
+d.invert = False
+# background brightness (0-1)
+d.bgbrightness = 0.5
+# sweep duration (sec)
+d.sweepSec = 0.010
+# post-sweep duration to display blank screen (sec)
+d.postsweepSec = 0
+
+vs = Variables()
+vs.moviei = Variable(vals=d.moviei, dim=0, shuffle=False) # kwargs: vals, dim, shuffle, random
+vs.framei = Variable(vals=d.framei, dim=1, shuffle=False) # play each movie through in turn
+
+runs = Runs(n=1, reshuffle=False)
+
+#bs = BlankSweeps(T=7, sec=2, shuffle=False) # blank sweep every T sweeps for sec seconds
+
+e = Movie(script=__file__,
+          static=s, dynamic=d, variables=vs,
+          runs=runs, blanksweeps=None) # create a playlist Movie experiment
+e.run() # run it
@@ -0,0 +1,14 @@
+"""Runs several Experiment scripts back to back in a single Session, on the same screen"""
+
+import os
+from dimstim.Session import Session
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+# Experiment scripts to run, in order
+scripts = ['bar.py',
+           'driftgrating.py',
+           'sparsenoise.py']
+
+s = Session(scripts=[ os.path.join(path, script) for script in scripts ]) # create a Session
+s.run() # run it